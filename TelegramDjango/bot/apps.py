@@ -1,6 +1,29 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+# Start the queue workers when the app loads, so updates stored before a
+# restart are processed without waiting for a new one (0 leaves it to enqueue).
+QUEUE_AUTOSTART = os.getenv("BOT_QUEUE_AUTOSTART", "1") == "1"
+
+
+def _serving():
+    """False for management commands other than runserver, and for runserver's reloader parent."""
+    argv = sys.argv
+    if not argv or os.path.basename(argv[0]) not in ("manage.py", "django-admin", "__main__.py"):
+        # gunicorn, uvicorn and other servers import the app directly.
+        return True
+    if len(argv) < 2 or argv[1] != "runserver":
+        return False
+    return "--noreload" in argv or os.environ.get("RUN_MAIN") == "true"
+
 
 class BotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bot'
+
+    def ready(self):
+        if QUEUE_AUTOSTART and _serving():
+            from . import work_queue
+            work_queue.start_workers()
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import os
+import re
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from . import dedup, file_cache, groq_client, handlers, llm, metrics, ratelimit, telegram, views, work_queue
+from .views import (
+    REPLY_ERROR,
+    REPLY_OPTIONS,
+    STREAM_REPLIES,
+    TRANSCRIPTION_ERROR,
+    TRANSCRIPTION_MODEL,
+    TWITTER_URL_PATTERN,
+    build_messages,
+    cache_reply,
+    cached_reply,
+    clean_filename,
+    fetch_twitter_video_url,
+    prepare_voice,
+    remember,
+    remember_voice,
+    uses_memory,
+)
+
+# Upper bound on conversations processed concurrently by one ASGI process.
+ASYNC_MAX_INFLIGHT = int(os.getenv("BOT_ASYNC_MAX_INFLIGHT", "500"))
+# Updates waiting for or holding a slot; beyond this the webhook answers 503.
+ASYNC_MAX_QUEUED = int(os.getenv("BOT_ASYNC_MAX_QUEUED", "2000"))
+
+_inflight = set()
+_updates = set()
+_semaphore = None
+
+
+async def send_message(chat_id, text):
+    payload = {"chat_id": chat_id, "text": text}
+    with metrics.stage("send_message"):
+        return await telegram.acall("sendMessage", payload)
+
+
+async def send_voice(chat_id, audio_file):
+    """Sends an audio (voice message) to Telegram, given a file or an uploaded file_id"""
+    if isinstance(audio_file, str):
+        with metrics.stage("send_voice"):
+            return await telegram.acall("sendVoice", {"chat_id": chat_id, "voice": audio_file})
+
+    files = {"voice": ("reply.ogg", audio_file, "audio/ogg")}
+    data = {"chat_id": chat_id}
+
+    with metrics.stage("send_voice"):
+        return await telegram.acall("sendVoice", data, files=files)
+
+
+async def generate_reply(message_text, message_type=None, chat_id=None):
+    cache_key, reply_text = cached_reply(message_text, message_type, chat_id)
+    if reply_text is not None:
+        return reply_text
+    if not await ratelimit.aacquire(chat_id):
+        return ratelimit.limited_reply()
+    # History may have to be loaded from the database. Not thread-sensitive: a
+    # summary being written for another chat must not hold this one up.
+    messages = await sync_to_async(build_messages, thread_sensitive=False)(message_text, message_type, chat_id)
+    answer = llm.track_answer()
+    try:
+        with metrics.stage("llm"):
+            reply_text = (await llm.acomplete(messages, message_type, **REPLY_OPTIONS)).strip()
+    except Exception as e:
+        print(f"Error generating reply: {e}")
+        return REPLY_ERROR
+    if cache_key:
+        cache_reply(cache_key, reply_text, answer)
+    if uses_memory(chat_id, message_type):
+        # Summarising may call the model again; keep it off the reply path.
+        task = asyncio.create_task(
+            sync_to_async(remember, thread_sensitive=False)(chat_id, message_type, message_text, reply_text)
+        )
+        _inflight.add(task)
+        task.add_done_callback(_inflight.discard)
+    return reply_text
+
+
+async def send_reply(chat_id, message_text, message_type=None):
+    """Async counterpart of views.send_reply; a streamed reply runs the sync streamer on a worker thread."""
+    if STREAM_REPLIES:
+        return await asyncio.to_thread(views.send_reply, chat_id, message_text, message_type)
+    reply_text = await generate_reply(message_text, message_type, chat_id)
+    await send_message(chat_id, reply_text)
+    return reply_text
+
+
+async def transcribe_voice(file_name, file_content):
+    try:
+        with metrics.stage("transcribe"):
+            transcription = await groq_client.atranscribe(
+                (file_name, file_content),
+                TRANSCRIPTION_MODEL,
+                response_format="verbose_json",
+            )
+        return transcription.text
+    except Exception as e:
+        print(f"Error in transcription: {e}")
+        return TRANSCRIPTION_ERROR
+
+
+async def reply_with_voice(chat_id, reply_text, text_sent=False):
+    """Sends the text reply (unless it was streamed) while the same reply is synthesised, then sends the voice."""
+    if not handlers.is_enabled("tts"):
+        if not text_sent:
+            await send_message(chat_id, reply_text)
+        return
+    if text_sent:
+        cache_key, voice = await asyncio.to_thread(prepare_voice, reply_text)
+    else:
+        _, (cache_key, voice) = await asyncio.gather(
+            send_message(chat_id, reply_text),
+            asyncio.to_thread(prepare_voice, reply_text),
+        )
+    if voice is None:
+        return
+    response = await send_voice(chat_id, voice)
+    remember_voice(cache_key, voice, response)
+    if isinstance(voice, str) and not response.get("ok"):
+        # The stored file_id was rejected; upload the audio again.
+        cache_key, voice = await asyncio.to_thread(prepare_voice, reply_text)
+        if voice is not None:
+            response = await send_voice(chat_id, voice)
+            remember_voice(cache_key, voice, response)
+
+
+@handlers.register_async("voice")
+async def handle_voice(ctx):
+    voice = ctx.message["voice"]
+    file_path, download_url = await handlers.aresolve_file(voice)
+    if not file_path:
+        await send_message(ctx.chat_id, "Sorry, could not retrieve the audio file.")
+        return
+
+    transcription_text = file_cache.get_result("transcription", voice.get("file_unique_id"))
+    if transcription_text is None:
+        with metrics.stage("download"):
+            file_content = await telegram.adownload(download_url)
+        transcription_text = await transcribe_voice("voice.ogg", file_content)
+        if transcription_text != TRANSCRIPTION_ERROR:
+            file_cache.put_result("transcription", voice.get("file_unique_id"), transcription_text)
+
+    if STREAM_REPLIES:
+        reply_text = await send_reply(ctx.chat_id, transcription_text, "voice")
+        await reply_with_voice(ctx.chat_id, reply_text, text_sent=True)
+    else:
+        reply_text = await generate_reply(transcription_text, "voice", ctx.chat_id)
+        await reply_with_voice(ctx.chat_id, reply_text)
+    ctx.record("voice", transcription_text, reply_text, download_url)
+
+
+@handlers.register_async("text")
+async def handle_text(ctx):
+    message_text = ctx.message.get("text", "")
+    match = re.search(TWITTER_URL_PATTERN, message_text)
+
+    if match:
+        video_url = await asyncio.to_thread(fetch_twitter_video_url, match.group(0))
+        reply_text = f"Download video here:\n{video_url}"
+        await send_message(ctx.chat_id, reply_text)
+    else:
+        reply_text = await send_reply(ctx.chat_id, message_text, "text")
+        video_url = reply_text
+    ctx.record("text", message_text, reply_text, video_url)
+
+
+@handlers.register_async("sticker")
+async def handle_sticker(ctx):
+    emoji = ctx.message["sticker"].get("emoji", "")
+    reply_text = await send_reply(ctx.chat_id, emoji, "sticker")
+    ctx.record("sticker", ctx.message["sticker"].get("emoji", "Sticker received"), reply_text)
+
+
+@handlers.register_async("animation")
+async def handle_animation(ctx):
+    file_name = ctx.message["animation"].get("file_name", "animation.gif").split(".")[0]
+    cleaned_name = clean_filename(file_name)
+    reply_text = await send_reply(ctx.chat_id, cleaned_name, "animation")
+    ctx.record("animation", cleaned_name, reply_text)
+
+
+@handlers.register_async("poll")
+async def handle_poll(ctx):
+    question = ctx.message["poll"].get("question", "")
+    if question:
+        reply_text = await send_reply(ctx.chat_id, question, "poll")
+        ctx.record("poll", question, reply_text)
+
+
+@handlers.register_async("venue")
+async def handle_venue(ctx):
+    venue = ctx.message["venue"]
+    venue_title = venue.get("title", "")
+    venue_address = venue.get("address", "")
+    if venue_title or venue_address:
+        venue_info = f"Venue: {venue_title}\nAddress: {venue_address}"
+        reply_text = await send_reply(ctx.chat_id, venue_info, "venue")
+        ctx.record("venue", venue_info, reply_text)
+
+
+# Photos, videos, documents and the fallback only acknowledge the message, so
+# they run the handlers in views.py on a worker thread.
+async def process_update(update):
+    """Async counterpart of views.process_update."""
+    await handlers.adispatch(update)
+
+
+async def _run(update, job_id):
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(ASYNC_MAX_INFLIGHT)
+    async with _semaphore:
+        delivery = telegram.track_delivery()
+        try:
+            with metrics.stage("total"):
+                await process_update(update)
+        except Exception as e:
+            print(f"Error processing update {update.get('update_id')}: {e}")
+            metrics.incr("queue.failed")
+            # Retried by the queue workers unless the user already got a reply.
+            await asyncio.to_thread(work_queue.fail, job_id, 1, delivery)
+        else:
+            await asyncio.to_thread(work_queue.finish, job_id)
+            metrics.incr("queue.processed")
+
+
+@csrf_exempt
+async def webhook(request):
+    """ASGI webhook: stores the update in the work queue, then processes it on the event loop.
+
+    The stored job is leased to this process; if it is restarted before the
+    job finishes, the queue workers pick the update up once the lease expires.
+    """
+    if request.method == "POST":
+        try:
+            update = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"status": "error"}, status=400)
+        if not isinstance(update, dict) or "update_id" not in update:
+            return JsonResponse({"status": "error"}, status=400)
+        if await dedup.ais_duplicate(update["update_id"]):
+            return JsonResponse({"status": "ok"})
+
+        if len(_updates) >= ASYNC_MAX_QUEUED:
+            print(f"Async webhook busy ({len(_updates)} updates waiting or running)")
+            metrics.incr("queue.rejected")
+            await dedup.aforget(update["update_id"])
+            # Telegram retries non-2xx responses, so the update is not lost.
+            return JsonResponse({"status": "busy"}, status=503)
+        try:
+            job_id = await asyncio.to_thread(work_queue.enqueue, update, True)
+        except Exception as e:
+            # QueueFull, or the queue database locked or unwritable.
+            print(f"Could not queue update {update['update_id']}: {e}")
+            await dedup.aforget(update["update_id"])
+            # Telegram retries non-2xx responses, so the update is not lost.
+            return JsonResponse({"status": "busy"}, status=503)
+
+        task = asyncio.create_task(_run(update, job_id))
+        _updates.add(task)
+        task.add_done_callback(_updates.discard)
+        metrics.set_gauge("async.updates", len(_updates))
+        return JsonResponse({"status": "ok"})
+    return JsonResponse({"status": "error"}, status=400)
@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+import re
+
+from .ttl_cache import TTLCache
+
+COMPLETION_CACHE_SIZE = int(os.getenv("BOT_COMPLETION_CACHE_SIZE", "2048"))
+COMPLETION_CACHE_TTL = float(os.getenv("BOT_COMPLETION_CACHE_TTL", "86400"))
+# Name of a Django cache (settings.CACHES) shared by every worker process; empty disables it.
+COMPLETION_CACHE_ALIAS = os.getenv("BOT_COMPLETION_CACHE_ALIAS", "")
+# Message types whose replies may be served from cache. Free-form text chats
+# run at temperature=1 and are expected to vary, so they opt out by default.
+COMPLETION_CACHE_TYPES = set(
+    filter(None, os.getenv("BOT_COMPLETION_CACHE_TYPES", "sticker,animation,poll,venue").split(","))
+)
+
+_cache = TTLCache("completion_cache", COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL, COMPLETION_CACHE_ALIAS)
+
+
+def is_enabled(message_type):
+    return COMPLETION_CACHE_SIZE > 0 and message_type in COMPLETION_CACHE_TYPES
+
+
+def normalise(prompt):
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def make_key(prompt, model, **params):
+    """Content address for a completion: normalised prompt, model and sampling params."""
+    payload = json.dumps(
+        {"prompt": normalise(prompt), "model": model, "params": params},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return "completion:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    """Returns a cached completion or None, checking the local tier before the shared one."""
+    return _cache.get(key)
+
+
+def put(key, value):
+    _cache.put(key, value)
+
+
+def clear():
+    _cache.clear()
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import threading
+from collections import deque
+
+from django.core.cache import caches
+
+from . import metrics
+
+# Number of recent update_ids remembered in memory.
+DEDUP_WINDOW = int(os.getenv("BOT_DEDUP_WINDOW", "10000"))
+# Optional Django cache (settings.CACHES) that makes the window survive restarts
+# and be shared between processes; empty keeps it in memory only. The async
+# webhook reaches it through a worker thread, so a DatabaseCache works there too.
+DEDUP_CACHE_ALIAS = os.getenv("BOT_DEDUP_CACHE_ALIAS", "")
+# Telegram gives up redelivering an update after about a day.
+DEDUP_CACHE_TTL = int(os.getenv("BOT_DEDUP_CACHE_TTL", "86400"))
+
+_lock = threading.Lock()
+_order = deque()
+_seen = set()
+_stats = {"unique": 0, "duplicate": 0}
+
+
+def _record(duplicate):
+    with _lock:
+        _stats["duplicate" if duplicate else "unique"] += 1
+        total = _stats["unique"] + _stats["duplicate"]
+        metrics.set_gauge("dedup.duplicate_rate", _stats["duplicate"] / total)
+    metrics.incr("dedup.duplicates" if duplicate else "dedup.unique")
+
+
+def _shared_add(update_id):
+    """Returns False if another process already claimed update_id."""
+    if not DEDUP_CACHE_ALIAS:
+        return True
+    try:
+        return caches[DEDUP_CACHE_ALIAS].add(f"update:{update_id}", 1, timeout=DEDUP_CACHE_TTL)
+    except Exception as e:
+        print(f"Shared dedup cache unavailable: {e}")
+        return True
+
+
+def is_duplicate(update_id):
+    """Records update_id and returns True if it was already seen in the window."""
+    with _lock:
+        duplicate = update_id in _seen
+        if not duplicate:
+            _seen.add(update_id)
+            _order.append(update_id)
+            while len(_order) > DEDUP_WINDOW:
+                _seen.discard(_order.popleft())
+
+    if not duplicate and not _shared_add(update_id):
+        duplicate = True
+    _record(duplicate)
+    return duplicate
+
+
+def forget(update_id):
+    """Removes update_id so a redelivery is processed, e.g. when it could not be queued."""
+    with _lock:
+        if update_id in _seen:
+            _seen.discard(update_id)
+            try:
+                _order.remove(update_id)
+            except ValueError:
+                pass
+    if DEDUP_CACHE_ALIAS:
+        try:
+            caches[DEDUP_CACHE_ALIAS].delete(f"update:{update_id}")
+        except Exception as e:
+            print(f"Shared dedup cache unavailable: {e}")
+
+
+async def ais_duplicate(update_id):
+    """is_duplicate() for the event loop; the shared cache may be database-backed, so it is called on a thread."""
+    if DEDUP_CACHE_ALIAS:
+        return await asyncio.to_thread(is_duplicate, update_id)
+    return is_duplicate(update_id)
+
+
+async def aforget(update_id):
+    if DEDUP_CACHE_ALIAS:
+        await asyncio.to_thread(forget, update_id)
+    else:
+        forget(update_id)
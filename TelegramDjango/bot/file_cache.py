@@ -0,0 +1,61 @@
+import os
+
+from . import telegram
+from .ttl_cache import TTLCache
+
+FILE_CACHE_SIZE = int(os.getenv("BOT_FILE_CACHE_SIZE", "4096"))
+# Telegram keeps a getFile download link valid for at least one hour.
+FILE_PATH_TTL = float(os.getenv("BOT_FILE_PATH_TTL", "3300"))
+# Derived results (transcriptions, OCR text, ...) never change for a given file.
+FILE_RESULT_TTL = float(os.getenv("BOT_FILE_RESULT_TTL", str(7 * 86400)))
+FILE_CACHE_ALIAS = os.getenv("BOT_FILE_CACHE_ALIAS", "")
+
+_paths = TTLCache("file_path_cache", FILE_CACHE_SIZE, FILE_PATH_TTL)
+_results = TTLCache("file_result_cache", FILE_CACHE_SIZE, FILE_RESULT_TTL, FILE_CACHE_ALIAS)
+
+
+def _cached_path(file_id, file_unique_id):
+    for key in (file_id, file_unique_id):
+        if key:
+            file_path = _paths.get(key)
+            if file_path:
+                return file_path
+    return None
+
+
+def _remember_path(file_id, file_unique_id, file_path):
+    for key in (file_id, file_unique_id):
+        if key:
+            _paths.put(key, file_path)
+
+
+def get_file_path(file_id, file_unique_id=None):
+    """Resolves a file to its file_path, calling getFile only when the cached link has expired."""
+    file_path = _cached_path(file_id, file_unique_id)
+    if file_path is None:
+        file_path = telegram.get_file(file_id)
+        if file_path:
+            _remember_path(file_id, file_unique_id, file_path)
+    return file_path
+
+
+async def aget_file_path(file_id, file_unique_id=None):
+    """Async counterpart of :func:`get_file_path`."""
+    file_path = _cached_path(file_id, file_unique_id)
+    if file_path is None:
+        file_path = await telegram.aget_file(file_id)
+        if file_path:
+            _remember_path(file_id, file_unique_id, file_path)
+    return file_path
+
+
+def get_result(kind, file_unique_id):
+    """Returns a memoised result of processing a file (e.g. its transcription), if any."""
+    if not file_unique_id:
+        return None
+    return _results.get(f"{kind}:{file_unique_id}")
+
+
+def put_result(kind, file_unique_id, value):
+    if file_unique_id:
+        _results.put(f"{kind}:{file_unique_id}", value)
@@ -0,0 +1,310 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import groq
+from dotenv import load_dotenv
+from groq import AsyncGroq, Groq
+
+from . import metrics
+
+load_dotenv()
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# Total time a call may take, retries and backoff included.
+GROQ_DEADLINE = float(os.getenv("GROQ_DEADLINE", "45"))
+# Timeout of a single attempt (never longer than what is left of the deadline).
+GROQ_ATTEMPT_TIMEOUT = float(os.getenv("GROQ_ATTEMPT_TIMEOUT", "20"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_BACKOFF_SECONDS = float(os.getenv("GROQ_BACKOFF_SECONDS", "0.5"))
+# Send a second, identical completion request if the first has not answered
+# within this many seconds and use whichever finishes first. 0 disables hedging.
+GROQ_HEDGE_AFTER = float(os.getenv("GROQ_HEDGE_AFTER", "0"))
+# Consecutive failed attempts that open the circuit, and how long it stays open.
+GROQ_BREAKER_FAILURES = int(os.getenv("GROQ_BREAKER_FAILURES", "5"))
+GROQ_BREAKER_RESET = float(os.getenv("GROQ_BREAKER_RESET", "30"))
+
+# Retries are done here, with the deadline in mind, so the SDK must not add its own.
+client = Groq(api_key=GROQ_API_KEY, max_retries=0)
+async_client = AsyncGroq(api_key=GROQ_API_KEY, max_retries=0)
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="groq-hedge")
+
+# Failures that say nothing about the request itself, so it may be sent again.
+RETRYABLE_ERRORS = (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling Groq while the circuit breaker is open."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when no attempt succeeded before the call's deadline."""
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive failures, then lets one trial call through after `reset` seconds."""
+
+    def __init__(self, failures, reset):
+        self.failures = failures
+        self.reset = reset
+        self.lock = threading.Lock()
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial = False
+        self.trial_at = None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset:
+                return False
+            # A trial that never reported back (e.g. its task was cancelled)
+            # is given up on after `reset`, so the breaker cannot stay open for good.
+            if self.trial and now - self.trial_at < self.reset:
+                return False
+            # Half-open: a single call finds out whether Groq is back.
+            self.trial = True
+            self.trial_at = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self.trial = False
+        metrics.set_gauge("groq.breaker.open", 0)
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive += 1
+            self.trial = False
+            if self.failures and self.consecutive >= self.failures:
+                if self.opened_at is None:
+                    print(f"Groq circuit opened after {self.consecutive} failures")
+                self.opened_at = time.monotonic()
+        if self.opened_at is not None:
+            metrics.set_gauge("groq.breaker.open", 1)
+
+
+breaker = CircuitBreaker(GROQ_BREAKER_FAILURES, GROQ_BREAKER_RESET)
+
+
+def _parse_duration(value):
+    """Parses Groq's reset headers ("7.66s", "2m59.56s", "120ms") into seconds."""
+    total = 0.0
+    for number, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value or ""):
+        total += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total or None
+
+
+def _server_delay(error):
+    """How long Groq asked us to wait, from retry-after or the rate-limit reset headers."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    resets = [
+        _parse_duration(headers.get(name))
+        for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+    ]
+    resets = [reset for reset in resets if reset]
+    return max(resets) if resets else None
+
+
+def _retry_delay(error, attempt, remaining):
+    """Returns how long to wait before retrying after ``error``, or None if it is final."""
+    if not isinstance(error, RETRYABLE_ERRORS) or attempt >= GROQ_MAX_RETRIES:
+        return None
+    if breaker.opened_at is not None:
+        # This failure opened the breaker (or it was a half-open trial); the retry would be refused.
+        return None
+    delay = _server_delay(error)
+    if delay is None:
+        # Full jitter keeps workers that failed together from retrying together.
+        delay = random.uniform(0, GROQ_BACKOFF_SECONDS * (2 ** attempt))
+    if delay >= remaining:
+        return None
+    return delay
+
+
+def _counts_against_breaker(error):
+    # A 429 means Groq is up and we are too fast; 4xx means the request is wrong.
+    return isinstance(error, (groq.APIConnectionError, groq.InternalServerError))
+
+
+def _attempt(create, model, timeout, kwargs):
+    start = time.monotonic()
+    try:
+        result = create(timeout=timeout, **kwargs)
+    except Exception as e:
+        metrics.incr(f"groq.errors.{model}")
+        if _counts_against_breaker(e):
+            breaker.record_failure()
+        else:
+            # Groq answered, so it is up even if it refused this request.
+            breaker.record_success()
+        raise
+    metrics.observe(f"groq.latency.{model}", time.monotonic() - start)
+    breaker.record_success()
+    return result
+
+
+def _hedged_attempt(create, model, timeout, kwargs):
+    """Runs one attempt, racing a duplicate against it if it is slower than GROQ_HEDGE_AFTER."""
+    first = _hedge_pool.submit(_attempt, create, model, timeout, kwargs)
+    done, _ = wait([first], timeout=GROQ_HEDGE_AFTER)
+    if done:
+        return first.result()
+
+    metrics.incr("groq.hedges")
+    second = _hedge_pool.submit(_attempt, create, model, max(timeout - GROQ_HEDGE_AFTER, 0.1), kwargs)
+    pending = {first, second}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    metrics.incr("groq.hedge_wins")
+                return future.result()
+    # Both failed; report the original attempt's error.
+    return first.result()
+
+
+def call(create, model, deadline=None, retries=True, hedge=False, **kwargs):
+    """Calls ``create(model=model, **kwargs)`` under a deadline, with retries and the circuit breaker."""
+    deadline_at = time.monotonic() + (deadline or GROQ_DEADLINE)
+    attempt = 0
+    while True:
+        # Checked first, so a half-open trial is only taken by a call that makes it.
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Groq call to {model} exceeded its deadline")
+        if not breaker.allow():
+            metrics.incr("groq.breaker.rejected")
+            raise CircuitOpen("Groq circuit breaker is open")
+        timeout = min(GROQ_ATTEMPT_TIMEOUT, remaining)
+        try:
+            # A half-open breaker allowed a single trial request, so it is not hedged.
+            if hedge and GROQ_HEDGE_AFTER > 0 and not breaker.trial:
+                return _hedged_attempt(create, model, timeout, dict(kwargs, model=model))
+            return _attempt(create, model, timeout, dict(kwargs, model=model))
+        except Exception as e:
+            delay = _retry_delay(e, attempt, deadline_at - time.monotonic()) if retries else None
+            if delay is None:
+                raise
+            metrics.incr("groq.retries")
+            print(f"Groq call to {model} failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def chat(messages, model, stream=False, deadline=None, **options):
+    """Creates a chat completion. Non-streaming calls may be hedged; streams are retried until they start."""
+    return call(
+        client.chat.completions.create, model, deadline,
+        hedge=not stream, messages=messages, stream=stream, **options,
+    )
+
+
+def transcribe(file, model, deadline=None, **options):
+    """Transcribes ``file`` (a (name, content) tuple). Streamed content cannot be resent, so it is tried once."""
+    return call(
+        client.audio.transcriptions.create, model, deadline,
+        retries=isinstance(file[1], bytes), file=file, **options,
+    )
+
+
+async def _aattempt(create, model, timeout, kwargs):
+    start = time.monotonic()
+    try:
+        result = await create(timeout=timeout, **kwargs)
+    except Exception as e:
+        metrics.incr(f"groq.errors.{model}")
+        if _counts_against_breaker(e):
+            breaker.record_failure()
+        else:
+            # Groq answered, so it is up even if it refused this request.
+            breaker.record_success()
+        raise
+    metrics.observe(f"groq.latency.{model}", time.monotonic() - start)
+    breaker.record_success()
+    return result
+
+
+async def _ahedged_attempt(create, model, timeout, kwargs):
+    first = asyncio.ensure_future(_aattempt(create, model, timeout, kwargs))
+    done, _ = await asyncio.wait([first], timeout=GROQ_HEDGE_AFTER)
+    if done:
+        return first.result()
+
+    metrics.incr("groq.hedges")
+    second = asyncio.ensure_future(
+        _aattempt(create, model, max(timeout - GROQ_HEDGE_AFTER, 0.1), kwargs)
+    )
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        metrics.incr("groq.hedge_wins")
+                    return task.result()
+        return first.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def acall(create, model, deadline=None, retries=True, hedge=False, **kwargs):
+    deadline_at = time.monotonic() + (deadline or GROQ_DEADLINE)
+    attempt = 0
+    while True:
+        # Checked first, so a half-open trial is only taken by a call that makes it.
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Groq call to {model} exceeded its deadline")
+        if not breaker.allow():
+            metrics.incr("groq.breaker.rejected")
+            raise CircuitOpen("Groq circuit breaker is open")
+        timeout = min(GROQ_ATTEMPT_TIMEOUT, remaining)
+        try:
+            # A half-open breaker allowed a single trial request, so it is not hedged.
+            if hedge and GROQ_HEDGE_AFTER > 0 and not breaker.trial:
+                return await _ahedged_attempt(create, model, timeout, dict(kwargs, model=model))
+            return await _aattempt(create, model, timeout, dict(kwargs, model=model))
+        except Exception as e:
+            delay = _retry_delay(e, attempt, deadline_at - time.monotonic()) if retries else None
+            if delay is None:
+                raise
+            metrics.incr("groq.retries")
+            print(f"Groq call to {model} failed ({e}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def achat(messages, model, stream=False, deadline=None, **options):
+    return await acall(
+        async_client.chat.completions.create, model, deadline,
+        hedge=not stream, messages=messages, stream=stream, **options,
+    )
+
+
+async def atranscribe(file, model, deadline=None, **options):
+    return await acall(
+        async_client.audio.transcriptions.create, model, deadline,
+        retries=isinstance(file[1], bytes), file=file, **options,
+    )
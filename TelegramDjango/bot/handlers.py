@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import file_cache, metrics, persistence, telegram
+
+# Handlers or features (e.g. "video,tts") switched off from start-up.
+DISABLED = set(filter(None, os.getenv("BOT_DISABLED_HANDLERS", "").split(",")))
+# One name per line; edit the file to switch handlers off or on without a restart.
+SWITCHES_FILE = os.getenv("BOT_SWITCHES_FILE", str(settings.BASE_DIR / "disabled_handlers.txt"))
+SWITCHES_CHECK_SECONDS = float(os.getenv("BOT_SWITCHES_CHECK_SECONDS", "2"))
+
+DISABLED_REPLY = "Sorry, I can't handle this kind of message right now. Please try again later."
+
+_handlers = []
+_async_handlers = {}
+_fallback = None
+_middleware = []
+
+_switches_lock = threading.Lock()
+_switches = {"names": frozenset(), "mtime": None, "checked": 0.0}
+
+
+class Context:
+    """One message on its way through the middleware to its handler."""
+
+    def __init__(self, update):
+        self.update = update
+        self.message = update["message"]
+        self.chat = self.message["chat"]
+        self.chat_id = self.chat["id"]
+        self.content_type = None
+        self.handler = None
+        # What gets saved as the Chat row.
+        self.message_type = "unknown"
+        self.message_content = ""
+        self.reply_message = "No reply generated."
+        self.download_file = ""
+
+    def record(self, message_type, message_content, reply_message, download_file=""):
+        self.message_type = message_type
+        self.message_content = message_content
+        self.reply_message = reply_message
+        self.download_file = download_file
+
+
+def register(content_type):
+    """Registers ``func(ctx)`` for messages carrying content_type; earlier registrations win."""
+    def decorator(func):
+        _handlers.append((content_type, func))
+        return func
+    return decorator
+
+
+def register_async(content_type):
+    """Registers an awaitable ``func(ctx)`` that adispatch() runs instead of the handler for content_type.
+
+    Content types without one ("other" is the fallback) run their sync
+    handler on a worker thread.
+    """
+    def decorator(func):
+        _async_handlers[content_type] = func
+        return func
+    return decorator
+
+
+def fallback(func):
+    """Registers the handler for messages no other handler claims."""
+    global _fallback
+    _fallback = func
+    return func
+
+
+def middleware(func):
+    """Registers a generator ``func(ctx)`` that yields once, around the handler.
+
+    The first registered runs outermost, for dispatch() and adispatch() alike.
+    """
+    func = contextmanager(func)
+    _middleware.append(func)
+    return func
+
+
+def _disabled_names():
+    now = time.monotonic()
+    with _switches_lock:
+        if now - _switches["checked"] < SWITCHES_CHECK_SECONDS:
+            return _switches["names"]
+        _switches["checked"] = now
+        try:
+            mtime = os.stat(SWITCHES_FILE).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != _switches["mtime"]:
+            names = set()
+            if mtime is not None:
+                with open(SWITCHES_FILE) as switches_file:
+                    names = {line.strip() for line in switches_file if line.strip() and not line.startswith("#")}
+            _switches["names"] = frozenset(names)
+            _switches["mtime"] = mtime
+            print(f"Disabled handlers: {sorted(DISABLED | names) or 'none'}")
+        return _switches["names"]
+
+
+def is_enabled(name):
+    """False if name is switched off by BOT_DISABLED_HANDLERS or the switches file."""
+    return name not in DISABLED and name not in _disabled_names()
+
+
+def find_handler(message):
+    for content_type, func in _handlers:
+        if content_type in message:
+            return content_type, func
+    return "other", _fallback
+
+
+def _disabled(ctx):
+    if is_enabled(ctx.content_type):
+        return False
+    metrics.incr(f"handler.{ctx.content_type}.disabled")
+    ctx.record(ctx.content_type, "", DISABLED_REPLY)
+    return True
+
+
+def _context(update):
+    if "message" not in update:
+        return None
+    ctx = Context(update)
+    ctx.content_type, ctx.handler = find_handler(ctx.message)
+    return ctx
+
+
+def _enter_middleware(stack, ctx):
+    for func in _middleware:
+        stack.enter_context(func(ctx))
+
+
+def dispatch(update):
+    """Runs the registered handler for an update's message through the middleware chain."""
+    ctx = _context(update)
+    if ctx is None:
+        return None
+    with ExitStack() as stack:
+        _enter_middleware(stack, ctx)
+        if _disabled(ctx):
+            with metrics.stage("send_message"):
+                telegram.call("sendMessage", {"chat_id": ctx.chat_id, "text": DISABLED_REPLY})
+        else:
+            ctx.handler(ctx)
+    return ctx
+
+
+async def adispatch(update):
+    """Async counterpart of :func:`dispatch`, preferring handlers from register_async()."""
+    ctx = _context(update)
+    if ctx is None:
+        return None
+    with ExitStack() as stack:
+        _enter_middleware(stack, ctx)
+        if _disabled(ctx):
+            with metrics.stage("send_message"):
+                await telegram.acall("sendMessage", {"chat_id": ctx.chat_id, "text": DISABLED_REPLY})
+        elif ctx.content_type in _async_handlers:
+            await _async_handlers[ctx.content_type](ctx)
+        else:
+            await sync_to_async(ctx.handler, thread_sensitive=False)(ctx)
+    return ctx
+
+
+@middleware
+def persistence_middleware(ctx):
+    """Saves the exchange as a Chat row once the handler has finished, failed or not."""
+    try:
+        yield
+    except Exception as e:
+        if ctx.message_type == "unknown":
+            ctx.record(ctx.content_type, "", f"Error: {e}")
+        raise
+    finally:
+        try:
+            persistence.save_chat(
+                chat_id=ctx.chat_id,
+                username=ctx.chat.get("username", ""),
+                first_name=ctx.chat.get("first_name", ""),
+                last_name=ctx.chat.get("last_name", ""),
+                message_type=ctx.message_type,
+                reply_message=ctx.reply_message,
+                message_content=ctx.message_content,
+                download_file=ctx.download_file,
+            )
+        except Exception as e:
+            print(e)
+
+
+@middleware
+def timing_middleware(ctx):
+    """Per-handler latency and error counts (handler.<content type> on /metrics/)."""
+    try:
+        with metrics.timed(f"handler.{ctx.content_type}"):
+            yield
+    except Exception:
+        metrics.incr(f"handler.{ctx.content_type}.errors")
+        raise
+
+
+def resolve_file(media):
+    """Returns (file_path, download_url) for a Telegram file object, or (None, "") if it can't be fetched."""
+    if media.get("file_size", 0) > telegram.MAX_DOWNLOAD_BYTES:
+        return None, ""
+    with metrics.stage("get_file"):
+        file_path = file_cache.get_file_path(media["file_id"], media.get("file_unique_id"))
+    if not file_path:
+        return None, ""
+    return file_path, telegram.file_url(file_path)
+
+
+async def aresolve_file(media):
+    """Async counterpart of :func:`resolve_file`."""
+    if media.get("file_size", 0) > telegram.MAX_DOWNLOAD_BYTES:
+        return None, ""
+    with metrics.stage("get_file"):
+        file_path = await file_cache.aget_file_path(media["file_id"], media.get("file_unique_id"))
+    if not file_path:
+        return None, ""
+    return file_path, telegram.file_url(file_path)
@@ -0,0 +1,240 @@
+import asyncio
+import contextvars
+import os
+import time
+
+import groq
+import httpx
+
+from . import groq_client, metrics, ollama_client
+
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.2-1b-preview")
+
+# Message types answered by the local model first, as long as the prompt is short.
+LLM_LOCAL_TYPES = set(filter(None, os.getenv("BOT_LLM_LOCAL_TYPES", "sticker,animation").split(",")))
+LLM_LOCAL_MAX_CHARS = int(os.getenv("BOT_LLM_LOCAL_MAX_CHARS", "200"))
+# A backend whose recent latency is above this is skipped for BOT_LLM_COOLDOWN_SECONDS.
+LLM_SLOW_SECONDS = float(os.getenv("BOT_LLM_SLOW_SECONDS", "8"))
+LLM_COOLDOWN_SECONDS = float(os.getenv("BOT_LLM_COOLDOWN_SECONDS", "30"))
+# Deadline given to a backend when there is another one to fail over to.
+LLM_FAILOVER_DEADLINE = float(os.getenv("BOT_LLM_FAILOVER_DEADLINE", "10"))
+# Weight of the newest sample in the latency moving average.
+LATENCY_SMOOTHING = 0.3
+
+_answered = contextvars.ContextVar("llm_answered", default=None)
+
+
+class Backend:
+    """A chat model the router can send a prompt to."""
+    name = ""
+
+    def __init__(self, model):
+        self.model = model
+        self.latency = None
+        self.unavailable_until = 0.0
+
+    def label(self):
+        """Names the backend and model, e.g. for keying what they produce."""
+        return f"{self.name}/{self.model}"
+
+    def is_configured(self):
+        return True
+
+    def is_healthy(self):
+        return time.monotonic() >= self.unavailable_until
+
+    def record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+        metrics.set_gauge(f"llm.{self.name}.latency", round(self.latency, 3))
+        if self.latency > LLM_SLOW_SECONDS:
+            # Start from a clean average when the cooldown ends.
+            self.mark_unavailable(f"average latency {self.latency:.1f}s")
+            self.latency = None
+
+    def mark_unavailable(self, reason):
+        print(f"LLM backend {self.name} unavailable for {LLM_COOLDOWN_SECONDS:.0f}s: {reason}")
+        self.unavailable_until = time.monotonic() + LLM_COOLDOWN_SECONDS
+        metrics.incr(f"llm.{self.name}.unavailable")
+
+    def complete(self, messages, deadline=None, **options):
+        """Returns the reply text for messages."""
+        raise NotImplementedError
+
+    def stream(self, messages, deadline=None, **options):
+        """Yields the reply text in pieces; backends without streaming yield it whole."""
+        yield self.complete(messages, deadline, **options)
+
+    async def acomplete(self, messages, deadline=None, **options):
+        return await asyncio.to_thread(self.complete, messages, deadline, **options)
+
+
+class GroqBackend(Backend):
+    name = "groq"
+
+    def complete(self, messages, deadline=None, **options):
+        completion = groq_client.chat(messages, self.model, deadline=deadline, **options)
+        return completion.choices[0].message.content
+
+    def stream(self, messages, deadline=None, **options):
+        response = groq_client.chat(messages, self.model, stream=True, deadline=deadline, **options)
+        for chunk in response:
+            yield getattr(chunk.choices[0].delta, "content", "") or ""
+
+    async def acomplete(self, messages, deadline=None, **options):
+        completion = await groq_client.achat(messages, self.model, deadline=deadline, **options)
+        return completion.choices[0].message.content
+
+
+class OllamaBackend(Backend):
+    name = "ollama"
+
+    def is_configured(self):
+        return bool(ollama_client.OLLAMA_URL)
+
+    def complete(self, messages, deadline=None, **options):
+        return ollama_client.chat(messages, self.model, ollama_options(options), deadline)
+
+    def stream(self, messages, deadline=None, **options):
+        return ollama_client.stream_chat(messages, self.model, ollama_options(options), deadline)
+
+
+def ollama_options(options):
+    """Translates OpenAI-style sampling options into Ollama's names."""
+    translated = {key: options[key] for key in ("temperature", "top_p") if key in options}
+    if "max_tokens" in options:
+        translated["num_predict"] = options["max_tokens"]
+    return translated
+
+
+def _is_overload(error):
+    # Errors that say the backend is down or saturated rather than the prompt being bad.
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (429, 503)
+    return isinstance(error, (
+        groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError,
+        groq_client.CircuitOpen, groq_client.DeadlineExceeded,
+        ollama_client.OllamaBusy, httpx.TransportError,
+    ))
+
+
+def track_answer():
+    """Starts recording, for the current thread or task, which backend answers the next prompt.
+
+    Returns a dict whose "model" the router sets to the answering
+    backend's label() once a reply is complete.
+    """
+    answer = {"model": None}
+    _answered.set(answer)
+    return answer
+
+
+def _note_answer(backend):
+    answer = _answered.get()
+    if answer is not None:
+        answer["model"] = backend.label()
+
+
+class Router:
+    """Orders backends for each prompt and fails over between them."""
+
+    def __init__(self, backends):
+        self.backends = backends
+
+    def order(self, message_type=None, prompt_chars=0):
+        backends = [backend for backend in self.backends if backend.is_configured()]
+        if message_type in LLM_LOCAL_TYPES and prompt_chars <= LLM_LOCAL_MAX_CHARS:
+            # Cheap prompts go to the local model first.
+            backends.sort(key=lambda backend: backend.name != "ollama")
+        # Healthy backends first, keeping the preference order within each group.
+        backends.sort(key=lambda backend: not backend.is_healthy())
+        return backends
+
+    def first_choice(self, message_type=None, prompt_chars=0):
+        """The label of the backend a prompt would be sent to first, or None if there is none."""
+        backends = self.order(message_type, prompt_chars)
+        return backends[0].label() if backends else None
+
+    def _attempts(self, messages, message_type):
+        backends = self.order(message_type, sum(len(m["content"]) for m in messages))
+        if not backends:
+            raise RuntimeError("No LLM backend is configured")
+        for index, backend in enumerate(backends):
+            last = index == len(backends) - 1
+            yield backend, None if last else LLM_FAILOVER_DEADLINE, last
+
+    def _failed(self, backend, error, last):
+        metrics.incr(f"llm.{backend.name}.errors")
+        if _is_overload(error):
+            backend.mark_unavailable(error)
+        if last:
+            raise error
+        metrics.incr("llm.failovers")
+        print(f"LLM backend {backend.name} failed ({error}), failing over")
+
+    def complete(self, messages, message_type=None, **options):
+        for backend, deadline, last in self._attempts(messages, message_type):
+            start = time.monotonic()
+            try:
+                reply_text = backend.complete(messages, deadline, **options)
+            except Exception as e:
+                self._failed(backend, e, last)
+                continue
+            backend.record_latency(time.monotonic() - start)
+            metrics.incr(f"llm.{backend.name}.replies")
+            _note_answer(backend)
+            return reply_text
+
+    def stream(self, messages, message_type=None, **options):
+        """Yields reply text; fails over only if a backend breaks before its first piece."""
+        for backend, deadline, last in self._attempts(messages, message_type):
+            start = time.monotonic()
+            started = False
+            try:
+                for content in backend.stream(messages, deadline, **options):
+                    if content and not started:
+                        started = True
+                        backend.record_latency(time.monotonic() - start)
+                    yield content
+            except Exception as e:
+                if started:
+                    raise
+                self._failed(backend, e, last)
+                continue
+            metrics.incr(f"llm.{backend.name}.replies")
+            _note_answer(backend)
+            return
+
+    async def acomplete(self, messages, message_type=None, **options):
+        for backend, deadline, last in self._attempts(messages, message_type):
+            start = time.monotonic()
+            try:
+                reply_text = await backend.acomplete(messages, deadline, **options)
+            except Exception as e:
+                self._failed(backend, e, last)
+                continue
+            backend.record_latency(time.monotonic() - start)
+            metrics.incr(f"llm.{backend.name}.replies")
+            _note_answer(backend)
+            return reply_text
+
+
+router = Router([GroqBackend(GROQ_MODEL), OllamaBackend(ollama_client.OLLAMA_MODEL)])
+
+
+def first_choice(message_type=None, prompt_chars=0):
+    return router.first_choice(message_type, prompt_chars)
+
+
+def complete(messages, message_type=None, **options):
+    return router.complete(messages, message_type, **options)
+
+
+def stream(messages, message_type=None, **options):
+    return router.stream(messages, message_type, **options)
+
+
+async def acomplete(messages, message_type=None, **options):
+    return await router.acomplete(messages, message_type, **options)
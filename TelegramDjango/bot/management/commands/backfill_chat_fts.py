@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bot import search
+
+
+class Command(BaseCommand):
+    help = "Indexes existing Chat rows into the full-text search table in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--start-id", type=int, default=None, help="Resume from this Chat id")
+        parser.add_argument("--sleep", type=float, default=0.0, help="Pause between batches to let writers in")
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            raise CommandError("The FTS table is missing; run `manage.py migrate` on SQLite first.")
+
+        total = 0
+        for last_id, indexed in search.backfill(options["batch_size"], options["start_id"]):
+            total += indexed
+            self.stdout.write(f"indexed up to id {last_id} (+{indexed})")
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+        self.stdout.write(self.style.SUCCESS(f"Backfill complete, {total} rows indexed"))
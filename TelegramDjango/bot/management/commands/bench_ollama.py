@@ -0,0 +1,71 @@
+import shutil
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bot import ollama_client
+
+PROMPT = "Reply with one short friendly sentence: I am feeling happy"
+
+
+def bench(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compares `ollama run` per message with the pooled Ollama HTTP client."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--concurrency", type=int, default=ollama_client.OLLAMA_MAX_CONCURRENCY)
+        parser.add_argument("--max-tokens", type=int, default=32)
+
+    def handle(self, *args, **options):
+        if not ollama_client.OLLAMA_URL:
+            raise CommandError("Set OLLAMA_URL (e.g. http://localhost:11434) to the running Ollama server")
+        model = ollama_client.OLLAMA_MODEL
+        messages = [{"role": "user", "content": PROMPT}]
+        llm_options = {"num_predict": options["max_tokens"]}
+        repeat = options["repeat"]
+
+        start = time.perf_counter()
+        ollama_client.preload(model)
+        self.stdout.write(f"preload {model}: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        self.stdout.write(f"{'path':>12} {'median ms':>10} {'min ms':>8}")
+        ollama = shutil.which("ollama")
+        if ollama:
+            median, best = bench(
+                lambda: subprocess.run([ollama, "run", model], input=PROMPT, text=True, capture_output=True),
+                repeat,
+            )
+            self.stdout.write(f"{'subprocess':>12} {median * 1000:>10.0f} {best * 1000:>8.0f}")
+        else:
+            self.stdout.write("ollama CLI not found, only the HTTP client is measured")
+
+        median, best = bench(lambda: ollama_client.chat(messages, model, llm_options), repeat)
+        self.stdout.write(f"{'http':>12} {median * 1000:>10.0f} {best * 1000:>8.0f}")
+
+        def first_token():
+            for content in ollama_client.stream_chat(messages, model, llm_options):
+                if content:
+                    break
+
+        median, best = bench(first_token, repeat)
+        self.stdout.write(f"{'http ttft':>12} {median * 1000:>10.0f} {best * 1000:>8.0f}")
+
+        concurrency = options["concurrency"]
+        requests = concurrency * repeat
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            start = time.perf_counter()
+            list(pool.map(lambda _: ollama_client.chat(messages, model, llm_options), range(requests)))
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f"{requests} requests at concurrency {concurrency}: {requests / elapsed:.2f} req/s")
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+from bot.models import Chat
+
+PROFILES = {
+    # What DATABASES looked like before the production profile.
+    "default": {"CONN_MAX_AGE": 0, "OPTIONS": {}},
+    "tuned": {
+        "CONN_MAX_AGE": settings.DATABASES["default"].get("CONN_MAX_AGE", 0),
+        "OPTIONS": settings.DATABASES["default"].get("OPTIONS", {}),
+    },
+}
+
+
+class Command(BaseCommand):
+    help = "Hammers Chat inserts from N threads against a scratch database for each SQLite profile."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--rows", type=int, default=200, help="Inserts per thread")
+        parser.add_argument("--profiles", default="default,tuned")
+
+    def _configure(self, alias, path, profile):
+        settings_dict = dict(connections.settings["default"])
+        settings_dict.update(NAME=path, TEST={}, **PROFILES[profile])
+        connections.settings[alias] = settings_dict
+        call_command("migrate", "bot", database=alias, verbosity=0)
+        connections[alias].close()
+
+    def _worker(self, alias, rows, errors):
+        for i in range(rows):
+            try:
+                Chat.objects.using(alias).create(
+                    chat_id=threading.get_ident(),
+                    message_type="text",
+                    message_content=f"benchmark message {i}",
+                    reply_message="benchmark reply",
+                )
+            except OperationalError:
+                errors.append(1)
+            # Mirrors what Django does at the end of every request.
+            connections[alias].close_if_unusable_or_obsolete()
+        connections[alias].close()
+
+    def handle(self, *args, **options):
+        threads, rows = options["threads"], options["rows"]
+        with tempfile.TemporaryDirectory() as tmp:
+            for profile in options["profiles"].split(","):
+                alias = f"bench_{profile}"
+                self._configure(alias, os.path.join(tmp, f"{profile}.sqlite3"), profile)
+
+                errors = []
+                workers = [
+                    threading.Thread(target=self._worker, args=(alias, rows, errors))
+                    for _ in range(threads)
+                ]
+                start = time.perf_counter()
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                elapsed = time.perf_counter() - start
+
+                written = Chat.objects.using(alias).count()
+                connections[alias].close()
+                self.stdout.write(
+                    f"{profile:>8}: {written} rows in {elapsed:.2f}s "
+                    f"({written / elapsed:.0f} inserts/s), {len(errors)} 'database is locked' errors"
+                )
@@ -0,0 +1,69 @@
+import array
+import io
+import math
+import shutil
+import statistics
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bot import transcoder
+
+
+def make_mp3(seconds, rate=24000):
+    """Encodes a tone as MP3, roughly what gTTS returns for a reply of that length."""
+    av = transcoder.av
+    mp3_fp = io.BytesIO()
+    with av.open(mp3_fp, "w", format="mp3") as target:
+        stream = target.add_stream("libmp3lame", rate=rate)
+        samples = int(seconds * rate)
+        pcm = array.array("h", (int(8000 * math.sin(2 * math.pi * 220 * i / rate)) for i in range(samples)))
+        for offset in range(0, samples, 1152):
+            chunk = pcm[offset:offset + 1152]
+            frame = av.AudioFrame(format="s16", layout="mono", samples=len(chunk))
+            frame.planes[0].update(chunk.tobytes())
+            frame.sample_rate = rate
+            for packet in stream.encode(frame):
+                target.mux(packet)
+        for packet in stream.encode(None):
+            target.mux(packet)
+    return mp3_fp.getvalue()
+
+
+def bench(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compares the pydub/ffmpeg subprocess transcoder with the in-process PyAV encoder."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--durations", default="5,15,30", help="Reply lengths in seconds")
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def handle(self, *args, **options):
+        if transcoder.av is None:
+            raise CommandError("PyAV is required to generate the benchmark input (pip install av)")
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg:
+            spawn, _ = bench(lambda: subprocess.run([ffmpeg, "-version"], capture_output=True), options["repeat"])
+            self.stdout.write(f"ffmpeg fork+exec alone: {spawn * 1000:.1f} ms")
+        else:
+            self.stdout.write("ffmpeg not found, only the in-process backend is measured")
+
+        self.stdout.write(f"{'seconds':>8} {'backend':>8} {'median ms':>10} {'min ms':>8} {'x realtime':>11}")
+        for seconds in [float(d) for d in options["durations"].split(",")]:
+            mp3_bytes = make_mp3(seconds)
+            for name, transcode in transcoder.BACKENDS.items():
+                if name == "pydub" and not ffmpeg:
+                    continue
+                median, best = bench(lambda: transcode(mp3_bytes), options["repeat"])
+                self.stdout.write(
+                    f"{seconds:>8.0f} {name:>8} {median * 1000:>10.1f} {best * 1000:>8.1f} {seconds / median:>11.0f}"
+                )
@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import OrderedDict, deque
+
+from . import metrics, persistence
+from .models import Chat
+
+# Message types whose replies see the conversation so far.
+MEMORY_TYPES = set(filter(None, os.getenv("BOT_MEMORY_TYPES", "text,voice").split(",")))
+# Prompt budget for the summary plus past turns; the new message always goes in.
+MEMORY_TOKEN_BUDGET = int(os.getenv("BOT_MEMORY_TOKEN_BUDGET", "1500"))
+# Older turns are folded into the summary once the window holds this many tokens.
+MEMORY_SUMMARY_THRESHOLD = int(os.getenv("BOT_MEMORY_SUMMARY_THRESHOLD", "3000"))
+# Number of past Chat rows loaded when a conversation is not in memory.
+MEMORY_LOAD_ROWS = int(os.getenv("BOT_MEMORY_LOAD_ROWS", "20"))
+# Conversations kept in memory; the least recently active are dropped first.
+MEMORY_MAX_CHATS = int(os.getenv("BOT_MEMORY_MAX_CHATS", "1000"))
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token plus per-message overhead)."""
+    return len(text or "") // 4 + 4
+
+
+class Conversation:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Held for a whole summarisation, so two folds never race on the summary.
+        self.summary_lock = threading.Lock()
+        self.summary = ""
+        self.turns = deque()
+        self.tokens = 0
+
+    def append(self, role, content):
+        self.turns.append((role, content))
+        self.tokens += estimate_tokens(content)
+
+    def popleft(self):
+        role, content = self.turns.popleft()
+        self.tokens -= estimate_tokens(content)
+        return role, content
+
+
+_lock = threading.Lock()
+_conversations = OrderedDict()
+
+
+def is_enabled(message_type):
+    return MEMORY_TOKEN_BUDGET > 0 and message_type in MEMORY_TYPES
+
+
+def _load(chat_id):
+    conversation = Conversation()
+    # Recent exchanges may still be in the write-behind buffer.
+    persistence.flush()
+    rows = (
+        Chat.objects.filter(chat_id=chat_id, message_type__in=MEMORY_TYPES)
+        .order_by("-timestamp")
+        .values_list("message_content", "reply_message")[:MEMORY_LOAD_ROWS]
+    )
+    for message_content, reply_message in reversed(list(rows)):
+        conversation.append("user", message_content)
+        if reply_message:
+            conversation.append("assistant", reply_message)
+    metrics.incr("memory.loads")
+    return conversation
+
+
+def get_conversation(chat_id):
+    with _lock:
+        conversation = _conversations.get(chat_id)
+        if conversation is not None:
+            _conversations.move_to_end(chat_id)
+            return conversation
+
+    conversation = _load(chat_id)
+    with _lock:
+        conversation = _conversations.setdefault(chat_id, conversation)
+        _conversations.move_to_end(chat_id)
+        while len(_conversations) > MEMORY_MAX_CHATS:
+            _conversations.popitem(last=False)
+        metrics.set_gauge("memory.chats", len(_conversations))
+    return conversation
+
+
+def build_messages(chat_id, message_text):
+    """Returns the chat messages for a new user message, kept within MEMORY_TOKEN_BUDGET."""
+    conversation = get_conversation(chat_id)
+    with conversation.lock:
+        budget = MEMORY_TOKEN_BUDGET - estimate_tokens(message_text)
+        history = []
+        if conversation.summary:
+            budget -= estimate_tokens(conversation.summary)
+        # Keep the most recent turns that fit.
+        for role, content in reversed(conversation.turns):
+            cost = estimate_tokens(content)
+            if cost > budget:
+                break
+            history.append({"role": role, "content": content})
+            budget -= cost
+        history.reverse()
+        summary = conversation.summary
+
+    messages = []
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the conversation so far: {summary}"})
+    messages.extend(history)
+    messages.append({"role": "user", "content": message_text})
+    metrics.set_gauge("memory.prompt_tokens", sum(estimate_tokens(m["content"]) for m in messages))
+    return messages
+
+
+def record(chat_id, message_text, reply_text, summarise=None):
+    """Appends a finished exchange and, past the threshold, folds older turns into the summary.
+
+    ``summarise(summary, turns)`` returns the new summary text; without it the
+    oldest turns are simply dropped.
+    """
+    conversation = get_conversation(chat_id)
+    with conversation.lock:
+        conversation.append("user", message_text)
+        conversation.append("assistant", reply_text)
+        if conversation.tokens <= MEMORY_SUMMARY_THRESHOLD:
+            return
+
+    with conversation.summary_lock:
+        with conversation.lock:
+            # A summarisation that held the lock before us may have folded enough already.
+            if conversation.tokens <= MEMORY_SUMMARY_THRESHOLD:
+                return
+            # Fold the older half of the window into the summary, a whole exchange at a time.
+            old_turns = []
+            while conversation.turns and conversation.tokens > MEMORY_SUMMARY_THRESHOLD // 2:
+                old_turns.append(conversation.popleft())
+                if conversation.turns and conversation.turns[0][0] == "assistant":
+                    old_turns.append(conversation.popleft())
+            summary = conversation.summary
+
+        if summarise is None:
+            metrics.incr("memory.truncations")
+            return
+        try:
+            with metrics.timed("memory.summarise"):
+                new_summary = summarise(summary, old_turns)
+        except Exception as e:
+            print(f"Error summarising conversation {chat_id}: {e}")
+            return
+        if new_summary:
+            with conversation.lock:
+                conversation.summary = new_summary
+            metrics.incr("memory.summaries")
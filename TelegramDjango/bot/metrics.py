@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Pipeline stages slower than this are logged; every stage is recorded.
+STAGE_WARN_SECONDS = float(os.getenv("BOT_STAGE_WARN_SECONDS", "10"))
+# Upper bounds (seconds) of the latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+
+
+def incr(name, amount=1):
+    """Increments a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    """Records the current value of a gauge."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    """Adds one latency sample to the histogram called ``name``."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            timing = _timings[name] = {
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+                "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            }
+        timing["count"] += 1
+        timing["total"] += seconds
+        timing["max"] = max(timing["max"], seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                timing["buckets"][i] += 1
+                break
+        else:
+            timing["buckets"][-1] += 1
+
+
+@contextmanager
+def timed(name, warn_seconds=None):
+    """Times the enclosed block and records it under ``name``, logging it if slower than warn_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(name, elapsed)
+        if warn_seconds is not None and elapsed > warn_seconds:
+            print(f"Slow {name}: {elapsed:.2f}s")
+
+
+def stage(name):
+    """Times one step of the reply pipeline as ``stage.<name>``."""
+    return timed(f"stage.{name}", STAGE_WARN_SECONDS)
+
+
+def _quantile(timing, q):
+    target = timing["count"] * q
+    seen = 0
+    for i, count in enumerate(timing["buckets"]):
+        seen += count
+        if seen >= target:
+            # A bucket bound can overshoot the largest sample actually seen.
+            return min(LATENCY_BUCKETS[i], timing["max"]) if i < len(LATENCY_BUCKETS) else timing["max"]
+    return timing["max"]
+
+
+def snapshot():
+    """Returns a JSON-serialisable copy of every metric."""
+    with _lock:
+        timings = {}
+        for name, timing in _timings.items():
+            timings[name] = {
+                "count": timing["count"],
+                "avg": timing["total"] / timing["count"] if timing["count"] else 0.0,
+                "max": timing["max"],
+                "p50": _quantile(timing, 0.5),
+                "p99": _quantile(timing, 0.99),
+            }
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings,
+        }
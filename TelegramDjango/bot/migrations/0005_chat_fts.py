@@ -0,0 +1,62 @@
+from django.db import migrations
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS bot_chat_fts USING fts5(
+        message_content, first_name, message_type, chat_id,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bot_chat_fts_insert AFTER INSERT ON bot_chat BEGIN
+        INSERT INTO bot_chat_fts (rowid, message_content, first_name, message_type, chat_id)
+        VALUES (new.id, new.message_content, new.first_name, new.message_type, new.chat_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bot_chat_fts_delete AFTER DELETE ON bot_chat BEGIN
+        DELETE FROM bot_chat_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS bot_chat_fts_update AFTER UPDATE ON bot_chat BEGIN
+        DELETE FROM bot_chat_fts WHERE rowid = old.id;
+        INSERT INTO bot_chat_fts (rowid, message_content, first_name, message_type, chat_id)
+        VALUES (new.id, new.message_content, new.first_name, new.message_type, new.chat_id);
+    END
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS bot_chat_fts_insert",
+    "DROP TRIGGER IF EXISTS bot_chat_fts_delete",
+    "DROP TRIGGER IF EXISTS bot_chat_fts_update",
+    "DROP TABLE IF EXISTS bot_chat_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 is SQLite specific; other backends keep Django's LIKE search.
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_chat_indexes'),
+    ]
+
+    # Existing rows are indexed with `manage.py backfill_chat_fts`, new rows by the triggers.
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
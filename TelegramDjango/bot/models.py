@@ -11,5 +11,13 @@ class Chat(models.Model):
     download_file = models.TextField(blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Serve the admin's per-chat and per-type filters, both ordered by time.
+            models.Index(fields=["chat_id", "timestamp"], name="bot_chat_chat_ts_idx"),
+            models.Index(fields=["message_type", "timestamp"], name="bot_chat_type_ts_idx"),
+            models.Index(fields=["timestamp"], name="bot_chat_ts_idx"),
+        ]
+
     def __str__(self):
         return f"Chat {self.chat_id} - {self.message_type}"
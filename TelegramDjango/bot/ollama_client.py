@@ -0,0 +1,127 @@
+import json
+import os
+import threading
+import time
+
+import httpx
+
+from . import metrics
+
+# Base URL of the long-running Ollama server, e.g. http://localhost:11434. Empty disables it.
+OLLAMA_URL = os.getenv("OLLAMA_URL", "").rstrip("/")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
+# How long Ollama keeps the model loaded after a request ("-1" keeps it forever).
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "2"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+# Requests sent to Ollama at once; match the server's OLLAMA_NUM_PARALLEL.
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+# How long a request waits for a free slot before giving up with OllamaBusy.
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "5"))
+
+_client = None
+_client_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(OLLAMA_MAX_CONCURRENCY)
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+class OllamaBusy(Exception):
+    """Raised when every concurrency slot stayed taken for OLLAMA_QUEUE_TIMEOUT."""
+
+
+def get_client():
+    """Returns the keep-alive client shared by every Ollama call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    base_url=OLLAMA_URL,
+                    limits=httpx.Limits(
+                        max_connections=OLLAMA_MAX_CONCURRENCY + 1,
+                        max_keepalive_connections=OLLAMA_MAX_CONCURRENCY + 1,
+                    ),
+                    timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+                )
+    return _client
+
+
+class _Slot:
+    """Holds one of the OLLAMA_MAX_CONCURRENCY request slots."""
+
+    def __enter__(self):
+        global _inflight
+        if not _slots.acquire(timeout=OLLAMA_QUEUE_TIMEOUT):
+            metrics.incr("ollama.busy")
+            raise OllamaBusy(f"All {OLLAMA_MAX_CONCURRENCY} Ollama slots are busy")
+        with _inflight_lock:
+            _inflight += 1
+            metrics.set_gauge("ollama.inflight", _inflight)
+        return self
+
+    def __exit__(self, *exc_info):
+        global _inflight
+        with _inflight_lock:
+            _inflight -= 1
+            metrics.set_gauge("ollama.inflight", _inflight)
+        _slots.release()
+
+
+def _payload(messages, model, stream, options):
+    return {
+        "model": model or OLLAMA_MODEL,
+        "messages": messages,
+        "stream": stream,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": options or {},
+    }
+
+
+def chat(messages, model=None, options=None, timeout=None):
+    """Returns the full reply text from /api/chat."""
+    with _Slot(), metrics.timed("ollama.chat"):
+        response = get_client().post(
+            "/api/chat",
+            json=_payload(messages, model, False, options),
+            timeout=timeout or OLLAMA_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()["message"]["content"]
+
+
+def stream_chat(messages, model=None, options=None, timeout=None):
+    """Yields reply text from /api/chat as Ollama generates it."""
+    with _Slot():
+        start = time.monotonic()
+        first = True
+        with get_client().stream(
+            "POST",
+            "/api/chat",
+            json=_payload(messages, model, True, options),
+            timeout=timeout or OLLAMA_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                content = chunk.get("message", {}).get("content", "")
+                if content and first:
+                    metrics.observe("ollama.first_token", time.monotonic() - start)
+                    first = False
+                yield content
+                if chunk.get("done"):
+                    break
+        metrics.observe("ollama.chat", time.monotonic() - start)
+
+
+def preload(model=None):
+    """Loads the model into memory ahead of the first message and pins it for OLLAMA_KEEP_ALIVE."""
+    response = get_client().post(
+        "/api/generate",
+        json={"model": model or OLLAMA_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE},
+    )
+    response.raise_for_status()
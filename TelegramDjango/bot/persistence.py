@@ -0,0 +1,89 @@
+import atexit
+import os
+import threading
+import time
+
+from django.db import close_old_connections
+
+from . import metrics
+from .models import Chat
+
+# Rows are written with one bulk_create once this many are buffered ...
+CHAT_FLUSH_SIZE = int(os.getenv("BOT_CHAT_FLUSH_SIZE", "50"))
+# ... or once the oldest buffered row is this many seconds old.
+CHAT_FLUSH_INTERVAL = float(os.getenv("BOT_CHAT_FLUSH_INTERVAL", "2"))
+# Upper bound on buffered rows if the database stays unavailable.
+CHAT_BUFFER_MAX = int(os.getenv("BOT_CHAT_BUFFER_MAX", "10000"))
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_buffer = []
+_wakeup = threading.Event()
+_flusher = None
+
+
+def save_chat(**fields):
+    """Buffers a Chat row; it is written by the background flusher.
+
+    Never touches the database itself, so it is safe to call from async code.
+    """
+    with _lock:
+        _buffer.append(Chat(**fields))
+        if len(_buffer) > CHAT_BUFFER_MAX:
+            del _buffer[0]
+            metrics.incr("persistence.dropped")
+        depth = len(_buffer)
+    metrics.set_gauge("persistence.buffer_depth", depth)
+    _start_flusher()
+    if depth >= CHAT_FLUSH_SIZE:
+        _wakeup.set()
+
+
+def flush():
+    """Writes every buffered row with bulk_create and returns how many were written."""
+    with _flush_lock:
+        with _lock:
+            rows = _buffer[:]
+            del _buffer[:]
+        if not rows:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            Chat.objects.bulk_create(rows, batch_size=500)
+        except Exception as e:
+            print(f"Error flushing {len(rows)} chats: {e}")
+            metrics.incr("persistence.flush_errors")
+            with _lock:
+                # Put the rows back in front so they are retried first.
+                _buffer[:0] = rows
+                del _buffer[:max(0, len(_buffer) - CHAT_BUFFER_MAX)]
+            return 0
+        finally:
+            metrics.observe("persistence.flush", time.perf_counter() - start)
+            metrics.set_gauge("persistence.buffer_depth", len(_buffer))
+
+        metrics.incr("persistence.rows_written", len(rows))
+        return len(rows)
+
+
+def _flush_loop():
+    while True:
+        _wakeup.wait(timeout=CHAT_FLUSH_INTERVAL)
+        _wakeup.clear()
+        close_old_connections()
+        flush()
+        close_old_connections()
+
+
+def _start_flusher():
+    global _flusher
+    if _flusher is not None:
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_loop, name="bot-chat-flusher", daemon=True)
+            _flusher.start()
+
+
+atexit.register(flush)
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+
+# Sustained Groq calls allowed per chat, and how many may burst above that.
+RATE_CHAT_PER_MINUTE = float(os.getenv("BOT_RATE_CHAT_PER_MINUTE", "20"))
+RATE_CHAT_BURST = float(os.getenv("BOT_RATE_CHAT_BURST", "5"))
+# Calls allowed per second across all chats; keep this under the Groq account limit.
+RATE_GLOBAL_PER_SECOND = float(os.getenv("BOT_RATE_GLOBAL_PER_SECOND", "25"))
+RATE_GLOBAL_BURST = float(os.getenv("BOT_RATE_GLOBAL_BURST", "50"))
+# What happens to a call over the limit: "reject" tells the user to slow down,
+# "delay" waits for a token (up to BOT_RATE_MAX_DELAY seconds, then rejects),
+# "degrade" answers with a canned reply instead of calling Groq.
+RATE_POLICY = os.getenv("BOT_RATE_POLICY", "degrade")
+RATE_MAX_DELAY = float(os.getenv("BOT_RATE_MAX_DELAY", "5"))
+# Per-chat buckets kept in memory; idle chats are dropped first.
+RATE_MAX_CHATS = int(os.getenv("BOT_RATE_MAX_CHATS", "10000"))
+
+RATE_LIMITED_REPLY = "You're sending messages too quickly. Please wait a moment and try again."
+DEGRADED_REPLY = "I'm a little busy right now, talk to me again in a moment! 😊"
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second up to `capacity`; may go negative to queue callers."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now):
+        """Takes one token and returns how long the caller must wait before using it."""
+        self.refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return -self.tokens / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+_lock = threading.Lock()
+_chat_buckets = OrderedDict()
+_global_bucket = TokenBucket(RATE_GLOBAL_PER_SECOND, RATE_GLOBAL_BURST)
+
+
+def is_enabled():
+    return RATE_CHAT_PER_MINUTE > 0 or RATE_GLOBAL_PER_SECOND > 0
+
+
+def _chat_bucket(chat_id):
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = _chat_buckets[chat_id] = TokenBucket(RATE_CHAT_PER_MINUTE / 60, RATE_CHAT_BURST)
+        while len(_chat_buckets) > RATE_MAX_CHATS:
+            _chat_buckets.popitem(last=False)
+        metrics.set_gauge("ratelimit.chats", len(_chat_buckets))
+    else:
+        _chat_buckets.move_to_end(chat_id)
+    return bucket
+
+
+def reserve(chat_id):
+    """Returns seconds to wait before calling Groq for chat_id, or None if the call is refused.
+
+    The chat's own bucket is charged first, so a chat over its limit is turned
+    away without spending global capacity that other chats are waiting for.
+    """
+    if not is_enabled():
+        return 0.0
+    max_wait = RATE_MAX_DELAY if RATE_POLICY == "delay" else 0.0
+    now = time.monotonic()
+    with _lock:
+        chat_wait = 0.0
+        chat_bucket = None
+        if chat_id is not None and RATE_CHAT_PER_MINUTE > 0:
+            chat_bucket = _chat_bucket(chat_id)
+            chat_wait = chat_bucket.reserve(now)
+            if chat_wait > max_wait:
+                chat_bucket.refund()
+                metrics.incr("ratelimit.limited.chat")
+                return None
+
+        global_wait = 0.0
+        if RATE_GLOBAL_PER_SECOND > 0:
+            global_wait = _global_bucket.reserve(now)
+            if global_wait > max_wait:
+                _global_bucket.refund()
+                if chat_bucket is not None:
+                    chat_bucket.refund()
+                metrics.incr("ratelimit.limited.global")
+                return None
+
+    wait = max(chat_wait, global_wait)
+    metrics.incr("ratelimit.admitted")
+    if wait:
+        metrics.incr("ratelimit.delayed")
+        metrics.observe("ratelimit.wait", wait)
+    return wait
+
+
+def acquire(chat_id):
+    """Admits one Groq call for chat_id, sleeping under the delay policy; False means don't call."""
+    wait = reserve(chat_id)
+    if wait is None:
+        return False
+    if wait:
+        time.sleep(wait)
+    return True
+
+
+async def aacquire(chat_id):
+    wait = reserve(chat_id)
+    if wait is None:
+        return False
+    if wait:
+        await asyncio.sleep(wait)
+    return True
+
+
+def limited_reply():
+    """The text sent in place of a reply that was not admitted."""
+    return DEGRADED_REPLY if RATE_POLICY == "degrade" else RATE_LIMITED_REPLY
+
+
+def is_limited_reply(text):
+    return text in (RATE_LIMITED_REPLY, DEGRADED_REPLY)
@@ -0,0 +1,71 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "bot_chat_fts"
+# Columns mirrored from bot_chat by the triggers in migration 0005; the rowid
+# is the Chat primary key.
+FTS_COLUMNS = ("message_content", "first_name", "message_type", "chat_id")
+
+_available = False
+
+
+def fts_available():
+    """True when the database is SQLite and the FTS table has been migrated in.
+
+    Only a positive answer is cached, so search switches to FTS as soon as
+    migration 0005 has run, without a restart.
+    """
+    global _available
+    if not _available:
+        _available = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _available
+
+
+def fts_query(search_term):
+    """Turns admin search input into an FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r"\w+", search_term)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def matching_ids(search_term):
+    """Subquery of Chat ids whose indexed columns match search_term."""
+    return RawSQL(
+        f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+        (fts_query(search_term),),
+    )
+
+
+def backfill(batch_size=5000, start_id=None):
+    """Indexes existing rows that the triggers have not seen, one id range at a time.
+
+    Safe to interrupt and re-run: rows already in the index are skipped.
+    Yields (last id processed, rows indexed in the batch) after each batch.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(id), MAX(id) FROM bot_chat")
+        min_id, max_id = cursor.fetchone()
+    if min_id is None:
+        return
+
+    low = min_id if start_id is None else max(start_id, min_id)
+    columns = ", ".join(FTS_COLUMNS)
+    while low <= max_id:
+        high = low + batch_size - 1
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {FTS_TABLE} (rowid, {columns})
+                SELECT id, {columns} FROM bot_chat
+                WHERE id BETWEEN %s AND %s
+                  AND id NOT IN (SELECT rowid FROM {FTS_TABLE} WHERE rowid BETWEEN %s AND %s)
+                """,
+                (low, high, low, high),
+            )
+            indexed = cursor.rowcount
+        yield high, indexed
+        low = high + 1
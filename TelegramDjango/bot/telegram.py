@@ -0,0 +1,382 @@
+import asyncio
+import contextvars
+import io
+import os
+import queue
+import random
+import threading
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from . import metrics
+
+load_dotenv()
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+
+BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+FILE_URL = f"https://api.telegram.org/file/bot{BOT_TOKEN}"
+
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "20"))
+KEEPALIVE_CONNECTIONS = int(os.getenv("TELEGRAM_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("TELEGRAM_KEEPALIVE_EXPIRY", "60"))
+CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+BACKOFF_SECONDS = float(os.getenv("TELEGRAM_BACKOFF_SECONDS", "0.5"))
+# Never sleep longer than this for a single retry_after, the queue retries later.
+MAX_RETRY_AFTER = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "30"))
+# Bot API downloads are capped at 20 MB by Telegram anyway.
+MAX_DOWNLOAD_BYTES = int(os.getenv("TELEGRAM_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Streaming downloads hold at most this many chunks in memory at once.
+DOWNLOAD_BUFFER_CHUNKS = int(os.getenv("TELEGRAM_DOWNLOAD_BUFFER_CHUNKS", "4"))
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# Bot API methods whose effect the user sees; see track_delivery().
+USER_VISIBLE_METHODS = frozenset({"sendMessage", "sendVoice", "editMessageText"})
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = {}
+_delivery = contextvars.ContextVar("telegram_delivery", default=None)
+
+
+def get_client():
+    """Returns the process-wide keep-alive client shared by every Telegram call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(
+                    http2=HTTP2,
+                    limits=httpx.Limits(
+                        max_connections=POOL_SIZE,
+                        max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=KEEPALIVE_EXPIRY,
+                    ),
+                    timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                )
+    return _client
+
+
+def get_async_client():
+    """Returns the keep-alive AsyncClient for the running event loop."""
+    loop = asyncio.get_running_loop()
+    # Clients of loops that have since closed (e.g. one per async_to_sync call) are dropped.
+    for other in list(_async_clients):
+        if other.is_closed():
+            _async_clients.pop(other, None)
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            http2=HTTP2,
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE,
+                max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return client
+
+
+def _backoff(attempt):
+    return BACKOFF_SECONDS * (2 ** attempt) * (0.5 + random.random())
+
+
+def _rewind(files):
+    for value in (files or {}).values():
+        fp = value[1] if isinstance(value, tuple) else value
+        if hasattr(fp, "seek"):
+            fp.seek(0)
+
+
+def _retry_delay(response, attempt):
+    """Returns how long to wait before retrying ``response``, or None if it is final."""
+    if response.status_code != 429 and response.status_code < 500:
+        return None
+    if attempt == MAX_RETRIES:
+        return None
+    delay = _backoff(attempt)
+    if response.status_code == 429:
+        try:
+            retry_after = response.json().get("parameters", {}).get("retry_after")
+        except ValueError:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            delay = min(float(retry_after), MAX_RETRY_AFTER)
+    return delay
+
+
+# Errors raised before the request reached Telegram, so it is safe to send again.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+# Telegram may also drop the connection after acting on a request, so this is
+# only retried for requests that can safely be repeated.
+IDEMPOTENT_RETRYABLE_ERRORS = RETRYABLE_ERRORS + (httpx.RemoteProtocolError,)
+
+
+def _retry_errors(api_method):
+    # Sending a message twice shows the user a duplicate.
+    return RETRYABLE_ERRORS if api_method in USER_VISIBLE_METHODS else IDEMPOTENT_RETRYABLE_ERRORS
+
+
+def request(method, url, retry_errors=IDEMPOTENT_RETRYABLE_ERRORS, **kwargs):
+    """Sends a request, retrying connection errors, 5xx and 429 responses.
+
+    A 429 from the Bot API carries ``parameters.retry_after``, which is
+    honoured instead of the exponential backoff.
+    """
+    client = get_client()
+    files = kwargs.get("files")
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            _rewind(files)
+        try:
+            response = client.request(method, url, **kwargs)
+        except retry_errors as e:
+            if attempt == MAX_RETRIES:
+                raise
+            metrics.incr("telegram.retries")
+            print(f"Telegram connection error, retrying: {e}")
+            time.sleep(_backoff(attempt))
+            continue
+
+        delay = _retry_delay(response, attempt)
+        if delay is None:
+            return response
+        metrics.incr("telegram.retries")
+        time.sleep(delay)
+    return response
+
+
+def track_delivery():
+    """Starts recording, for the current thread or task, whether the user has been sent anything.
+
+    Returns a dict whose "sent" turns True once a user-visible call
+    succeeds, or fails after it may have reached Telegram.
+    """
+    delivery = {"sent": False}
+    _delivery.set(delivery)
+    return delivery
+
+
+def _note_delivery(api_method):
+    delivery = _delivery.get()
+    if delivery is not None and api_method in USER_VISIBLE_METHODS:
+        delivery["sent"] = True
+
+
+def _decode(api_method, response):
+    try:
+        reply = response.json()
+    except ValueError:
+        return {"ok": False, "description": response.text}
+    if reply.get("ok"):
+        _note_delivery(api_method)
+    return reply
+
+
+def call(api_method, params=None, files=None):
+    """Calls a Bot API method and returns the decoded JSON reply."""
+    url = f"{BASE_URL}/{api_method}"
+    try:
+        with metrics.timed(f"telegram.{api_method}"):
+            retry_errors = _retry_errors(api_method)
+            if files:
+                response = request("POST", url, retry_errors, data=params, files=files)
+            else:
+                response = request("POST", url, retry_errors, json=params or {})
+    except RETRYABLE_ERRORS:
+        raise
+    except Exception:
+        # e.g. a read timeout or a dropped connection: the message may have gone out anyway.
+        _note_delivery(api_method)
+        raise
+    return _decode(api_method, response)
+
+
+def file_url(file_path):
+    return f"{FILE_URL}/{file_path}"
+
+
+def get_file(file_id):
+    """Resolves a file_id to its file_path, or None if Telegram refuses."""
+    file_info = call("getFile", {"file_id": file_id})
+    if file_info.get("ok"):
+        return file_info["result"]["file_path"]
+    return None
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+def download(url):
+    """Downloads a file over the pooled connection and returns its bytes."""
+    with metrics.timed("telegram.download"):
+        response = request("GET", url)
+    response.raise_for_status()
+    return response.content
+
+
+class StreamingDownload(io.RawIOBase):
+    """Read-only file object fed by a background download through a bounded buffer.
+
+    Passing it as an upload streams the Telegram file straight into the
+    request body, so at most DOWNLOAD_BUFFER_CHUNKS chunks are in memory
+    whatever the file size. The download is aborted with FileTooLarge once
+    it exceeds ``max_bytes``.
+    """
+
+    def __init__(self, url, max_bytes=MAX_DOWNLOAD_BYTES):
+        super().__init__()
+        self.url = url
+        self.max_bytes = max_bytes
+        self._chunks = queue.Queue(maxsize=DOWNLOAD_BUFFER_CHUNKS)
+        self._pending = b""
+        self._done = False
+        self._closed_event = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._closed_event.is_set():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        received = 0
+        try:
+            with metrics.timed("telegram.download"):
+                with get_client().stream("GET", self.url) as response:
+                    response.raise_for_status()
+                    for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        received += len(chunk)
+                        if received > self.max_bytes:
+                            raise FileTooLarge(f"Download exceeds {self.max_bytes} bytes")
+                        if not self._put(chunk):
+                            return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def readable(self):
+        return True
+
+    def _next_chunk(self):
+        if self._done:
+            return b""
+        item = self._chunks.get()
+        if item is None:
+            self._done = True
+            return b""
+        if isinstance(item, Exception):
+            self._done = True
+            raise item
+        return item
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self.readall()
+        while len(self._pending) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._pending += chunk
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def readall(self):
+        parts = [self._pending]
+        self._pending = b""
+        chunk = self._next_chunk()
+        while chunk:
+            parts.append(chunk)
+            chunk = self._next_chunk()
+        return b"".join(parts)
+
+    def close(self):
+        self._closed_event.set()
+        super().close()
+
+
+def stream_download(url, max_bytes=MAX_DOWNLOAD_BYTES):
+    """Starts downloading ``url`` and returns a bounded-memory file object for it."""
+    return StreamingDownload(url, max_bytes)
+
+
+async def arequest(method, url, retry_errors=IDEMPOTENT_RETRYABLE_ERRORS, **kwargs):
+    """Async counterpart of :func:`request` with the same retry policy."""
+    client = get_async_client()
+    files = kwargs.get("files")
+    for attempt in range(MAX_RETRIES + 1):
+        if attempt:
+            _rewind(files)
+        try:
+            response = await client.request(method, url, **kwargs)
+        except retry_errors as e:
+            if attempt == MAX_RETRIES:
+                raise
+            metrics.incr("telegram.retries")
+            print(f"Telegram connection error, retrying: {e}")
+            await asyncio.sleep(_backoff(attempt))
+            continue
+
+        delay = _retry_delay(response, attempt)
+        if delay is None:
+            return response
+        metrics.incr("telegram.retries")
+        await asyncio.sleep(delay)
+    return response
+
+
+async def acall(api_method, params=None, files=None):
+    """Async counterpart of :func:`call`."""
+    url = f"{BASE_URL}/{api_method}"
+    try:
+        with metrics.timed(f"telegram.{api_method}"):
+            retry_errors = _retry_errors(api_method)
+            if files:
+                response = await arequest("POST", url, retry_errors, data=params, files=files)
+            else:
+                response = await arequest("POST", url, retry_errors, json=params or {})
+    except RETRYABLE_ERRORS:
+        raise
+    except Exception:
+        _note_delivery(api_method)
+        raise
+    return _decode(api_method, response)
+
+
+async def aget_file(file_id):
+    """Async counterpart of :func:`get_file`."""
+    file_info = await acall("getFile", {"file_id": file_id})
+    if file_info.get("ok"):
+        return file_info["result"]["file_path"]
+    return None
+
+
+async def adownload(url, max_bytes=MAX_DOWNLOAD_BYTES):
+    """Async counterpart of :func:`download` that refuses files over ``max_bytes``."""
+    chunks = []
+    received = 0
+    with metrics.timed("telegram.download"):
+        async with get_async_client().stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                received += len(chunk)
+                if received > max_bytes:
+                    raise FileTooLarge(f"Download exceeds {max_bytes} bytes")
+                chunks.append(chunk)
+    return b"".join(chunks)
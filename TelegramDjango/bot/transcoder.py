@@ -0,0 +1,82 @@
+import io
+import os
+
+from . import metrics
+
+# "auto" prefers the in-process PyAV encoder and falls back to pydub/ffmpeg.
+TRANSCODER = os.getenv("BOT_TRANSCODER", "auto")
+OPUS_SAMPLE_RATE = 48000
+OPUS_BITRATE = int(os.getenv("BOT_OPUS_BITRATE", "32000"))
+
+try:
+    import av
+except ImportError:
+    av = None
+
+_warned = False
+
+
+def mp3_to_ogg_pydub(mp3_bytes):
+    """Transcodes through pydub, which forks an ffmpeg process for decode and encode."""
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_file(io.BytesIO(mp3_bytes), format="mp3")
+    ogg_fp = io.BytesIO()
+    audio.export(ogg_fp, format="ogg", codec="libopus")
+    return ogg_fp.getvalue()
+
+
+def mp3_to_ogg_av(mp3_bytes):
+    """Transcodes in-process with PyAV (libavcodec), working only on byte buffers."""
+    ogg_fp = io.BytesIO()
+    with av.open(io.BytesIO(mp3_bytes), format="mp3") as source, \
+            av.open(ogg_fp, "w", format="ogg") as target:
+        stream = target.add_stream("libopus", rate=OPUS_SAMPLE_RATE)
+        stream.bit_rate = OPUS_BITRATE
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=OPUS_SAMPLE_RATE)
+
+        for frame in source.decode(audio=0):
+            frame.pts = None
+            for resampled in resampler.resample(frame):
+                for packet in stream.encode(resampled):
+                    target.mux(packet)
+        for resampled in resampler.resample(None):
+            for packet in stream.encode(resampled):
+                target.mux(packet)
+        for packet in stream.encode(None):
+            target.mux(packet)
+    return ogg_fp.getvalue()
+
+
+BACKENDS = {
+    "pydub": mp3_to_ogg_pydub,
+    "av": mp3_to_ogg_av,
+}
+
+
+def get_backend(name=None):
+    global _warned
+    name = name or TRANSCODER
+    if name in ("auto", "av") and av is None:
+        if not _warned:
+            _warned = True
+            print("PyAV is not installed (pip install av), falling back to the slower pydub/ffmpeg transcoder")
+        name = "pydub"
+    elif name == "auto":
+        name = "av"
+    return name, BACKENDS[name]
+
+
+def mp3_to_ogg(mp3_bytes, backend=None):
+    """Converts MP3 bytes to OGG/Opus bytes for Telegram voice messages."""
+    name, transcode = get_backend(backend)
+    try:
+        with metrics.timed(f"transcoder.{name}"):
+            return transcode(mp3_bytes)
+    except Exception as e:
+        if name == "pydub":
+            raise
+        print(f"{name} transcoder failed, falling back to pydub: {e}")
+        metrics.incr("transcoder.fallback")
+        with metrics.timed("transcoder.pydub"):
+            return mp3_to_ogg_pydub(mp3_bytes)
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from . import metrics
+
+
+class TTLCache:
+    """In-process LRU cache with per-entry expiry and an optional shared Django cache tier.
+
+    Hits, misses and evictions are counted in bot.metrics under ``name``.
+    """
+
+    def __init__(self, name, maxsize, ttl, shared_alias=""):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _shared(self):
+        if self.shared_alias:
+            return caches[self.shared_alias]
+        return None
+
+    def get(self, key):
+        """Returns the cached value or None, checking the local tier before the shared one."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    metrics.incr(f"{self.name}.hit.local")
+                    return value
+                del self._entries[key]
+
+        shared = self._shared()
+        if shared is not None:
+            try:
+                value = shared.get(f"{self.name}:{key}")
+            except Exception as e:
+                print(f"Shared {self.name} cache unavailable: {e}")
+                value = None
+            if value is not None:
+                metrics.incr(f"{self.name}.hit.shared")
+                self._store_local(key, value, now, self.ttl)
+                return value
+
+        metrics.incr(f"{self.name}.miss")
+        return None
+
+    def _store_local(self, key, value, now, ttl):
+        with self._lock:
+            self._entries[key] = (value, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                metrics.incr(f"{self.name}.evicted")
+            metrics.set_gauge(f"{self.name}.size", len(self._entries))
+
+    def put(self, key, value, ttl=None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        self._store_local(key, value, time.monotonic(), ttl)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set(f"{self.name}:{key}", value, timeout=ttl)
+            except Exception as e:
+                print(f"Shared {self.name} cache unavailable: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            metrics.set_gauge(f"{self.name}.size", 0)
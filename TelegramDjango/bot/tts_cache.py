@@ -0,0 +1,153 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+TTS_CACHE_DIR = os.getenv("BOT_TTS_CACHE_DIR", str(settings.BASE_DIR / "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("BOT_TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# The directory is only walked when this process's running total goes over the
+# limit, or this often, to pick up what other processes have written.
+TTS_CACHE_SCAN_SECONDS = float(os.getenv("BOT_TTS_CACHE_SCAN_SECONDS", "300"))
+# A temporary file this old was left by a writer that died; younger ones are
+# still being written and are never evicted.
+TTS_CACHE_TMP_SECONDS = 3600
+
+_evict_lock = threading.Lock()
+# Size of the cache as of the last walk plus what this process wrote since.
+_size = {"bytes": None, "scanned": 0.0}
+
+
+def make_key(text, lang, voice="gtts", codec="libopus"):
+    """Content address for a rendered reply: (text hash, language, voice, codec)."""
+    text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{text_hash}:{lang}:{voice}:{codec}".encode("utf-8")).hexdigest()
+
+
+def _path(key, suffix):
+    return os.path.join(TTS_CACHE_DIR, key[:2], key + suffix)
+
+
+def _read(path, mode):
+    try:
+        with open(path, mode) as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"Error reading TTS cache: {e}")
+        return None
+    # Bump the mtime so eviction drops the least recently used entries first.
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def _write(path, data, mode):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Unique across threads and processes, so writers never share a partial file.
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def get_file_id(key):
+    """Returns the Telegram file_id of an already uploaded rendering, if any."""
+    file_id = _read(_path(key, ".id"), "r")
+    metrics.incr("tts_cache.file_id.hit" if file_id else "tts_cache.file_id.miss")
+    return file_id or None
+
+
+def get_audio(key):
+    """Returns the cached OGG/Opus bytes, if any."""
+    audio = _read(_path(key, ".ogg"), "rb")
+    metrics.incr("tts_cache.audio.hit" if audio else "tts_cache.audio.miss")
+    return audio
+
+
+def put_audio(key, audio):
+    """Stores a rendering; the cache is best-effort, so a failed write is only logged."""
+    try:
+        _write(_path(key, ".ogg"), audio, "wb")
+    except OSError as e:
+        print(f"Error writing TTS cache: {e}")
+        return
+    with _evict_lock:
+        if _size["bytes"] is not None:
+            _size["bytes"] += len(audio)
+        due = (_size["bytes"] is None or _size["bytes"] > TTS_CACHE_MAX_BYTES
+               or time.monotonic() - _size["scanned"] >= TTS_CACHE_SCAN_SECONDS)
+    if due:
+        try:
+            evict()
+        except OSError as e:
+            print(f"Error evicting TTS cache: {e}")
+
+
+def put_file_id(key, file_id):
+    try:
+        _write(_path(key, ".id"), file_id, "w")
+    except OSError as e:
+        print(f"Error writing TTS cache: {e}")
+
+
+def forget_file_id(key):
+    try:
+        os.remove(_path(key, ".id"))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Error writing TTS cache: {e}")
+
+
+def evict():
+    """Deletes least recently used entries until the cache fits in TTS_CACHE_MAX_BYTES."""
+    with _evict_lock:
+        entries = []
+        total = 0
+        now = time.time()
+        for root, _, files in os.walk(TTS_CACHE_DIR):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name.endswith(".tmp") and now - stat.st_mtime < TTS_CACHE_TMP_SECONDS:
+                    # Another writer's file, about to be renamed into place.
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        _size["scanned"] = time.monotonic()
+        _size["bytes"] = total
+        metrics.set_gauge("tts_cache.bytes", total)
+        if total <= TTS_CACHE_MAX_BYTES:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= TTS_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            metrics.incr("tts_cache.evicted")
+        _size["bytes"] = total
+        metrics.set_gauge("tts_cache.bytes", total)
@@ -1,28 +1,41 @@
 import os
 import re
 import json
+import time
 import requests
-from groq import Groq
-from .models import Chat
+from . import completion_cache, dedup, file_cache, groq_client, handlers, llm, memory, metrics, ratelimit, telegram, transcoder, tts_cache, work_queue
 from pprint import pprint
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from gtts import gTTS
-from pydub import AudioSegment
 import io
 from langdetect import detect
 from dotenv import load_dotenv
 
 load_dotenv()
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 X_RAPIDAPI_KEY = os.getenv("X_RAPIDAPI_KEY")
 
 # ngrok http --url=monkey-related-kangaroo.ngrok-free.app 8000
 WEBHOOK_URL = "https://monkey-related-kangaroo.ngrok-free.app/webhook/"
 
-BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
-client = Groq(api_key=GROQ_API_KEY)
+REPLY_OPTIONS = {"temperature": 1, "max_tokens": 1024, "top_p": 1}
+TRANSCRIPTION_MODEL = "whisper-large-v3"
+TRANSCRIPTION_ERROR = "Sorry, I'm having trouble transcribing your audio."
+REPLY_ERROR = "Sorry, I'm having trouble processing your request."
+SUMMARY_PROMPT = (
+    "Summarise this conversation in at most five sentences. Keep names, facts, "
+    "preferences and open questions; drop greetings and small talk."
+)
+
+# Streaming replies: the placeholder is edited at most every STREAM_EDIT_INTERVAL
+# seconds, and only once at least STREAM_MIN_CHARS new characters arrived.
+# The async webhook streams too, running stream_reply on a worker thread.
+STREAM_REPLIES = os.getenv("BOT_STREAM_REPLIES", "false").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.getenv("BOT_STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_MIN_CHARS = int(os.getenv("BOT_STREAM_MIN_CHARS", "30"))
+STREAM_PLACEHOLDER = "…"
+TELEGRAM_MAX_LENGTH = 4096
 
 def clean_filename(file_name):
     file_name = re.sub(r'\d+', '', file_name)
@@ -31,39 +44,168 @@ def clean_filename(file_name):
     return "I am feeling " + file_name
 
 def set_webhook():
-    url = f"{BASE_URL}/setWebhook"
-    response = requests.post(url, json={"url": WEBHOOK_URL})
-    return response.json()
+    return telegram.call("setWebhook", {"url": WEBHOOK_URL})
 
 def send_message(chat_id, text):
-    url = f"{BASE_URL}/sendMessage"
     payload = {"chat_id": chat_id, "text": text}
-    requests.post(url, json=payload)
-
-def generate_reply(message_text):
+    with metrics.stage("send_message"):
+        return telegram.call("sendMessage", payload)
+
+def edit_message(chat_id, message_id, text):
+    payload = {"chat_id": chat_id, "message_id": message_id, "text": text}
+    with metrics.stage("edit_message"):
+        return telegram.call("editMessageText", payload)
+
+def uses_memory(chat_id, message_type):
+    return chat_id is not None and memory.is_enabled(message_type)
+
+def build_messages(message_text, message_type=None, chat_id=None):
+    """Returns the prompt for message_text, with the chat's history when memory applies"""
+    if uses_memory(chat_id, message_type):
+        return memory.build_messages(chat_id, message_text)
+    return [{"role": "user", "content": message_text}]
+
+def summarise_history(summary, turns):
+    """Folds older turns into the running summary of a conversation"""
+    transcript = "\n".join(f"{role}: {content}" for role, content in turns)
+    summary = llm.complete(
+        [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Summary so far: {summary or 'none'}\n\n{transcript}"},
+        ],
+        "summary",
+        temperature=0.2,
+        max_tokens=256,
+    )
+    return summary.strip()
+
+def remember(chat_id, message_type, message_text, reply_text):
+    """Adds a successful exchange to the chat's memory"""
+    if (uses_memory(chat_id, message_type) and reply_text != REPLY_ERROR
+            and not ratelimit.is_limited_reply(reply_text)
+            and message_text != TRANSCRIPTION_ERROR):
+        memory.record(chat_id, message_text, reply_text, summarise=summarise_history)
+
+def cached_reply(message_text, message_type, chat_id=None):
+    """Returns (cache_key, cached reply) for message types that may use the completion cache
+
+    cache_key is (key, model) for the backend and model the router tries first.
+    """
+    # A reply that depends on the conversation so far cannot be shared.
+    if not completion_cache.is_enabled(message_type) or uses_memory(chat_id, message_type):
+        return None, None
+    model = llm.first_choice(message_type, len(message_text))
+    if model is None:
+        return None, None
+    key = completion_cache.make_key(message_text, model, **REPLY_OPTIONS)
+    return (key, model), completion_cache.get(key)
+
+def cache_reply(cache_key, reply_text, answer):
+    """Caches reply_text unless it came from another model than the one cache_key names (after a failover)"""
+    key, model = cache_key
+    if answer["model"] == model:
+        completion_cache.put(key, reply_text)
+    else:
+        metrics.incr("completion_cache.skipped")
+
+def complete_reply(messages, message_type=None, cache_key=None):
+    """Asks the model for a reply to messages; the caller has taken the rate-limit token"""
+    answer = llm.track_answer()
+    try:
+        with metrics.stage("llm"):
+            reply_text = llm.complete(messages, message_type, **REPLY_OPTIONS).strip()
+    except Exception as e:
+        print(f"Error generating reply: {e}")
+        return REPLY_ERROR
+    if cache_key:
+        cache_reply(cache_key, reply_text, answer)
+    return reply_text
+
+def generate_reply(message_text, message_type=None, chat_id=None):
+    cache_key, reply_text = cached_reply(message_text, message_type, chat_id)
+    if reply_text is not None:
+        return reply_text
+    if not ratelimit.acquire(chat_id):
+        return ratelimit.limited_reply()
+    return complete_reply(build_messages(message_text, message_type, chat_id), message_type, cache_key)
+
+def stream_reply(chat_id, message_text, cache_key=None, messages=None, message_type=None):
+    """Sends a placeholder, then edits it as the streamed completion arrives"""
+    messages = messages or [{"role": "user", "content": message_text}]
+    sent = send_message(chat_id, STREAM_PLACEHOLDER)
+    if not sent.get("ok"):
+        # send_reply already took this chat's rate-limit token.
+        reply_text = complete_reply(messages, message_type, cache_key)
+        send_message(chat_id, reply_text)
+        return reply_text
+
+    message_id = sent["result"]["message_id"]
+    reply_text = ""
+    shown_text = ""
+    last_edit = time.monotonic()
+    answer = llm.track_answer()
     try:
-        completion = client.chat.completions.create(
-            model="llama-3.2-1b-preview",
-            messages=[{"role": "user", "content": message_text}],
-            temperature=1,
-            max_tokens=1024,
-            top_p=1,
-            stream=False,
-        )
-        return completion.choices[0].message.content.strip()
+        with metrics.stage("llm"):
+            start = time.monotonic()
+            response = llm.stream(messages, message_type, **REPLY_OPTIONS)
+            for content in response:
+                if content and not reply_text:
+                    metrics.observe("llm.first_token", time.monotonic() - start)
+                reply_text += content
+
+                # Coalesce deltas so we stay well under Telegram's edit rate limits.
+                now = time.monotonic()
+                if (len(reply_text) - len(shown_text) >= STREAM_MIN_CHARS
+                        and now - last_edit >= STREAM_EDIT_INTERVAL):
+                    edit_message(chat_id, message_id, reply_text[:TELEGRAM_MAX_LENGTH])
+                    shown_text = reply_text
+                    last_edit = now
     except Exception as e:
-        return "Sorry, I'm having trouble processing your request."
+        print(f"Error while streaming reply: {e}")
+        cache_key = None
+        if not reply_text:
+            reply_text = REPLY_ERROR
+
+    reply_text = reply_text.strip()
+    if not reply_text:
+        # Never leave the placeholder standing in for a reply.
+        reply_text = REPLY_ERROR
+        cache_key = None
+    if reply_text != shown_text:
+        edit_message(chat_id, message_id, reply_text[:TELEGRAM_MAX_LENGTH])
+    if cache_key and reply_text:
+        cache_reply(cache_key, reply_text, answer)
+    return reply_text
+
+def send_reply(chat_id, message_text, message_type=None):
+    """Generates a reply to message_text and sends it, streaming it if enabled"""
+    if STREAM_REPLIES:
+        cache_key, reply_text = cached_reply(message_text, message_type, chat_id)
+        if reply_text is None and not ratelimit.acquire(chat_id):
+            reply_text = ratelimit.limited_reply()
+        if reply_text is None:
+            messages = build_messages(message_text, message_type, chat_id)
+            reply_text = stream_reply(chat_id, message_text, cache_key, messages, message_type)
+            remember(chat_id, message_type, message_text, reply_text)
+            return reply_text
+    else:
+        reply_text = generate_reply(message_text, message_type, chat_id)
+    send_message(chat_id, reply_text)
+    remember(chat_id, message_type, message_text, reply_text)
+    return reply_text
 
 def transcribe_voice(file_name, file_content):
     try:
-        transcription = client.audio.transcriptions.create(
-            file=(file_name, file_content),
-            model="whisper-large-v3",
-            response_format="verbose_json",
-        )
+        with metrics.stage("transcribe"):
+            transcription = groq_client.transcribe(
+                (file_name, file_content),
+                TRANSCRIPTION_MODEL,
+                response_format="verbose_json",
+            )
         return transcription.text
     except Exception as e:
-        return "Sorry, I'm having trouble transcribing your audio."
+        print(f"Error in transcription: {e}")
+        return TRANSCRIPTION_ERROR
 
 # def text_to_speech(text):
 #     """Converts text to an OGG audio file"""
@@ -86,11 +228,12 @@ def transcribe_voice(file_name, file_content):
 #         print(f"Error in text-to-speech conversion: {e}")
 #         return None
 
-def text_to_speech(text):
+def text_to_speech(text, detected_lang=None):
     """Detects language and converts text to an OGG audio file"""
     try:
         # Detect the language of the input text
-        detected_lang = detect(text)
+        if detected_lang is None:
+            detected_lang = detect(text)
         print(f"Detected Language: {detected_lang}")
 
         # Convert text to speech in the detected language
@@ -98,14 +241,12 @@ def text_to_speech(text):
         
         # Save as MP3 in memory
         mp3_fp = io.BytesIO()
-        tts.write_to_fp(mp3_fp)
-        mp3_fp.seek(0)
+        with metrics.stage("tts"):
+            tts.write_to_fp(mp3_fp)
 
         # Convert MP3 to OGG (Telegram supports OGG for voice messages)
-        audio = AudioSegment.from_file(mp3_fp, format="mp3")
-        ogg_fp = io.BytesIO()
-        audio.export(ogg_fp, format="ogg", codec="libopus")
-        ogg_fp.seek(0)
+        with metrics.stage("transcode"):
+            ogg_fp = io.BytesIO(transcoder.mp3_to_ogg(mp3_fp.getvalue()))
 
         return ogg_fp
     except Exception as e:
@@ -156,14 +297,64 @@ if ogg_audio:
 '''
 
 def send_voice(chat_id, audio_file):
-    """Sends an audio (voice message) to Telegram"""
-    url = f"{BASE_URL}/sendVoice"
+    """Sends an audio (voice message) to Telegram, given a file or an uploaded file_id"""
+    if isinstance(audio_file, str):
+        with metrics.stage("send_voice"):
+            return telegram.call("sendVoice", {"chat_id": chat_id, "voice": audio_file})
 
     files = {"voice": ("reply.ogg", audio_file, "audio/ogg")}
     data = {"chat_id": chat_id}
 
-    response = requests.post(url, data=data, files=files)
-    return response.json()
+    with metrics.stage("send_voice"):
+        return telegram.call("sendVoice", data, files=files)
+
+def prepare_voice(text):
+    """Returns (cache_key, voice) where voice is a cached file_id, an OGG file or None"""
+    try:
+        detected_lang = detect(text)
+    except Exception as e:
+        print(f"Error in language detection: {e}")
+        return None, None
+
+    cache_key = tts_cache.make_key(text, detected_lang)
+    file_id = tts_cache.get_file_id(cache_key)
+    if file_id:
+        return cache_key, file_id
+
+    audio = tts_cache.get_audio(cache_key)
+    if audio is None:
+        ogg_fp = text_to_speech(text, detected_lang)
+        if ogg_fp is None:
+            return cache_key, None
+        audio = ogg_fp.getvalue()
+        tts_cache.put_audio(cache_key, audio)
+    return cache_key, io.BytesIO(audio)
+
+def remember_voice(cache_key, voice, response):
+    """Stores the file_id Telegram assigned to an upload so repeats are sent by id"""
+    if not response.get("ok"):
+        if isinstance(voice, str):
+            tts_cache.forget_file_id(cache_key)
+        return
+    file_id = response.get("result", {}).get("voice", {}).get("file_id")
+    if file_id and not isinstance(voice, str):
+        tts_cache.put_file_id(cache_key, file_id)
+
+def send_voice_reply(chat_id, text):
+    """Speaks text as a voice message, reusing cached audio and file_ids"""
+    cache_key, voice = prepare_voice(text)
+    if voice is None:
+        return None
+    response = send_voice(chat_id, voice)
+    remember_voice(cache_key, voice, response)
+    if isinstance(voice, str) and not response.get("ok"):
+        # The stored file_id was rejected; upload the audio again.
+        cache_key, voice = prepare_voice(text)
+        if voice is None:
+            return response
+        response = send_voice(chat_id, voice)
+        remember_voice(cache_key, voice, response)
+    return response
 
 # https://rapidapi.com/JustMobi/api/twitter-downloader-download-twitter-videos-gifs-and-images/playground/apiendpoint_122abc35-1aef-4743-8f58-31b2d590f351
 def fetch_twitter_video_url(twitter_url):
@@ -184,221 +375,158 @@ def fetch_twitter_video_url(twitter_url):
             return video_url
     return "No downloadable video found."
 
+TWITTER_URL_PATTERN = r'(https?://(?:www\.)?(?:twitter|x)\.com/[A-Za-z0-9_]+/status/\d+)'
+
+def media_handler(content_type, reply_format, error_text=None, pick=None):
+    """Builds a handler that acknowledges a file and records its path"""
+    def handle(ctx):
+        media = ctx.message[content_type]
+        if pick:
+            media = pick(media)
+        file_path, download_url = handlers.resolve_file(media)
+        if not file_path:
+            if error_text:
+                send_message(ctx.chat_id, error_text)
+            return
+        reply_text = reply_format.format(file_path=file_path)
+        send_message(ctx.chat_id, reply_text)
+        ctx.record(content_type, file_path, reply_text, download_url)
+    handle.__name__ = f"handle_{content_type}"
+    return handle
+
+@handlers.register("voice")
+def handle_voice(ctx):
+    voice = ctx.message["voice"]
+    file_path, download_url = handlers.resolve_file(voice)
+    if not file_path:
+        send_message(ctx.chat_id, "Sorry, could not retrieve the audio file.")
+        return
+
+    print('\n\n', download_url, '\n\n')
+    # Forwarded copies of a voice note share its file_unique_id.
+    transcription_text = file_cache.get_result("transcription", voice.get("file_unique_id"))
+    if transcription_text is None:
+        # The download is piped into the Whisper upload as it arrives.
+        with telegram.stream_download(download_url) as file_content:
+            transcription_text = transcribe_voice("voice.ogg", file_content)
+        if transcription_text != TRANSCRIPTION_ERROR:
+            file_cache.put_result("transcription", voice.get("file_unique_id"), transcription_text)
+    print('\n\n', transcription_text, '\n\n')
+
+    reply_text = send_reply(ctx.chat_id, transcription_text, "voice")
+    # Speech synthesis can be switched off on its own under load.
+    if handlers.is_enabled("tts"):
+        send_voice_reply(ctx.chat_id, reply_text)
+    ctx.record("voice", transcription_text, reply_text, download_url)
+
+@handlers.register("text")
+def handle_text(ctx):
+    message_text = ctx.message.get("text", "")
+    match = re.search(TWITTER_URL_PATTERN, message_text)
+
+    if match:
+        video_url = fetch_twitter_video_url(match.group(0))
+        reply_text = f"Download video here:\n{video_url}"
+        send_message(ctx.chat_id, reply_text)
+    else:
+        reply_text = send_reply(ctx.chat_id, message_text, "text")
+        video_url = reply_text
+    ctx.record("text", message_text, reply_text, video_url)
+
+@handlers.register("sticker")
+def handle_sticker(ctx):
+    emoji = ctx.message["sticker"].get("emoji", "")
+    reply_text = send_reply(ctx.chat_id, emoji, "sticker")
+    ctx.record("sticker", ctx.message["sticker"].get("emoji", "Sticker received"), reply_text)
+
+handlers.register("video_note")(
+    media_handler("video_note", "Received video note.\nVideo Note: {file_path}")
+)
+
+# Animations also carry a "document", so this must be registered before it.
+@handlers.register("animation")
+def handle_animation(ctx):
+    file_name = ctx.message["animation"].get("file_name", "animation.gif").split(".")[0]
+    cleaned_name = clean_filename(file_name)
+    reply_text = send_reply(ctx.chat_id, cleaned_name, "animation")
+    ctx.record("animation", cleaned_name, reply_text)
+
+handlers.register("photo")(
+    media_handler(
+        "photo", "Received photo.\nPhoto Name: {file_path}",
+        error_text="Sorry, could not retrieve the photo.",
+        pick=lambda photos: photos[-1],  # Highest resolution
+    )
+)
+
+handlers.register("video")(
+    media_handler("video", "Received video.\nVideo Name: {file_path}")
+)
+
+@handlers.register("document")
+def handle_document(ctx):
+    document = ctx.message["document"]
+    file_path, download_url = handlers.resolve_file(document)
+    if not file_path:
+        send_message(ctx.chat_id, "Sorry, could not retrieve the document.")
+        return
+    reply_text = f"Received document: {document.get('file_name', 'Unknown Document')}"
+    send_message(ctx.chat_id, reply_text)
+    ctx.record("document", document.get("file_name", "Document received"), reply_text, download_url)
+
+@handlers.register("poll")
+def handle_poll(ctx):
+    question = ctx.message["poll"].get("question", "")
+    if question:
+        reply_text = send_reply(ctx.chat_id, question, "poll")
+        ctx.record("poll", question, reply_text)
+
+@handlers.register("venue")
+def handle_venue(ctx):
+    venue = ctx.message["venue"]
+    venue_title = venue.get("title", "")
+    venue_address = venue.get("address", "")
+    if venue_title or venue_address:
+        venue_info = f"Venue: {venue_title}\nAddress: {venue_address}"
+        reply_text = send_reply(ctx.chat_id, venue_info, "venue")
+        ctx.record("venue", venue_info, reply_text)
+
+@handlers.fallback
+def handle_other(ctx):
+    send_message(ctx.chat_id, 'https://blogforge.pythonanywhere.com/blogs/')
+
+def process_update(update):
+    """Runs the full reply pipeline for one Telegram update (called by queue workers)."""
+    handlers.dispatch(update)
+
 @csrf_exempt
 def webhook(request):
     if request.method == "POST":
-        update = json.loads(request.body)
+        try:
+            update = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({"status": "error"}, status=400)
+        if not isinstance(update, dict) or "update_id" not in update:
+            return JsonResponse({"status": "error"}, status=400)
         pprint(update)
 
-        if "message" in update:
-            message = update["message"]
-            chat_id = message["chat"]["id"]
-
-            username = message["chat"].get("username", "")
-            first_name = message["chat"].get("first_name", "")
-            last_name = message["chat"].get("last_name", "")
-
-            message_type = "unknown"
-            message_content = ""
-            reply_message = "No reply generated."
-            download_file = ""
-            download_url = ""
-
-            if "voice" in message:
-                voice = message["voice"]
-                file_id = voice["file_id"]
-
-                get_file_url = f"{BASE_URL}/getFile?file_id={file_id}"
-                file_info_response = requests.get(get_file_url)
-                file_info = file_info_response.json()
-
-                if file_info.get("ok"):
-                    file_path = file_info["result"]["file_path"]
-                    download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-
-                    print('\n\n', download_url, '\n\n')
-                    file_response = requests.get(download_url)
-                    file_content = file_response.content
-
-                    transcription_text = transcribe_voice("voice.ogg", file_content)
-                    print('\n\n', transcription_text, '\n\n')
-
-                    reply_text = generate_reply(transcription_text)
-                    send_message(chat_id, reply_text)
-                    audio_response = text_to_speech(reply_text)
-                    
-                    if audio_response:
-                        send_voice(chat_id, audio_response)
-
-                    message_type = "voice"
-                    message_content = transcription_text
-                    reply_message = reply_text
-                    download_file = download_url
-                else:
-                    send_message(chat_id, "Sorry, could not retrieve the audio file.")
-
-            elif "text" in message:
-                message_text = message.get("text", "")
-                twitter_url_pattern = r'(https?://(?:www\.)?(?:twitter|x)\.com/[A-Za-z0-9_]+/status/\d+)'
-                match = re.search(twitter_url_pattern, message_text)
-                
-                if match:
-                    twitter_url = match.group(0)
-                    video_url = fetch_twitter_video_url(twitter_url)
-                    reply_text = f"Download video here:\n{video_url}"
-                else:
-                    reply_text = generate_reply(message_text)
-                    video_url = reply_text
-
-                send_message(chat_id, reply_text)
-                message_type = "text"
-                message_content = message_text
-                reply_message = reply_text
-                download_file = video_url
-
-            elif "sticker" in message:
-                sticker_info = message["sticker"]
-                emoji = sticker_info.get("emoji", "")
-                reply_text = generate_reply(emoji)
-
-                send_message(chat_id, reply_text)
-                message_type = "sticker"
-                message_content = message["sticker"].get("emoji", "Sticker received")
-                reply_message = reply_text
-                download_file = download_url
-
-            elif "video_note" in message:
-                file_id = message["video_note"]["file_id"]
-                file_info = requests.get(f"{BASE_URL}/getFile?file_id={file_id}").json()
-
-                if file_info.get("ok"):
-                    file_path = file_info["result"]["file_path"]
-                    download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-
-                    reply_text = f"Received video note.\nVideo Note: {file_path}"
-                    send_message(chat_id, reply_text)
-                    message_type = "video_note"
-
-                    message_content = file_path
-                    reply_message = reply_text
-                    download_file = download_url
-
-            elif "animation" in message:
-                animation_info = message["animation"]
-                file_name = animation_info.get("file_name", "animation.gif")
-                file_name = file_name.split(".")[0]
-
-                cleaned_name = clean_filename(file_name)
-                reply_text = generate_reply(cleaned_name)
-                send_message(chat_id, reply_text)
-
-                message_type = "animation"
-                message_content = cleaned_name
-                reply_message = reply_text
-                download_file = download_url
-
-            elif "photo" in message:
-                file_id = message["photo"][-1]["file_id"]  # Get the highest resolution photo
-                file_info = requests.get(f"{BASE_URL}/getFile?file_id={file_id}").json()
-                
-                if file_info.get("ok"):
-                    file_path = file_info["result"]["file_path"]
-                    download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-                    
-                    reply_text = f"Received photo.\nPhoto Name: {file_path}"
-                    send_message(chat_id, reply_text)
-                    message_type = "photo"
-
-                    message_content = file_path
-                    reply_message = reply_text
-                    download_file = download_url
-                else:
-                    send_message(chat_id, "Sorry, could not retrieve the photo.")
-
-            elif "video" in message:
-                file_id = message["video"]["file_id"]
-
-                # Get file path
-                file_info = requests.get(f"{BASE_URL}/getFile?file_id={file_id}").json()
-                if file_info.get("ok"):
-                    file_path = file_info["result"]["file_path"]
-                    download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-
-                    reply_text = f"Received video.\nVideo Name: {file_path}"
-                    send_message(chat_id, reply_text)
-                    message_type = "video"
-
-                    message_content = file_path
-                    reply_message = reply_text
-                    download_file = download_url
-
-            elif "document" in message:
-                file_id = message["document"]["file_id"]
-                file_name = message["document"].get("file_name", "Unknown Document")
-                file_info = requests.get(f"{BASE_URL}/getFile?file_id={file_id}").json()
-                
-                if file_info.get("ok"):
-                    file_path = file_info["result"]["file_path"]
-                    download_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-                    
-                    reply_text = f"Received document: {file_name}"
-                    send_message(chat_id, reply_text)
-                    message_type = "document"
-
-                    message_content = message["document"].get("file_name", "Document received")
-                    reply_message = reply_text
-                    download_file = download_url
-                else:
-                    send_message(chat_id, "Sorry, could not retrieve the document.")
-
-            elif "poll" in message:
-                poll = message["poll"]
-                question = poll.get("question", "")
-
-                if question:
-                    reply_text = generate_reply(question)
-                    send_message(chat_id, reply_text)
-
-                    message_type = "poll"
-                    message_content = question
-                    reply_message = reply_text
-                    download_file = download_url
-
-            elif "venue" in message:
-                venue = message["venue"]
-                venue_title = venue.get("title", "")
-                venue_address = venue.get("address", "")
-
-                if venue_title or venue_address:
-                    venue_info = f"Venue: {venue_title}\nAddress: {venue_address}"
-                    reply_text = generate_reply(venue_info)
-                    send_message(chat_id, reply_text)
-
-                    message_type = "venue"
-                    message_content = venue_info
-                    reply_message = reply_text
-                    download_file = download_url
-
-            else:
-                send_message(chat_id, 
-                    'https://blogforge.pythonanywhere.com/blogs/')
-
-            try:
-                Chat.objects.create(
-                    chat_id=chat_id,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    message_type=message_type,
-                    reply_message=reply_message,
-                    message_content=message_content,
-                    download_file=download_file,
-                )
-            except Exception as e:
-                print(e)
-
+        # Telegram redelivers updates it thinks we missed; answer those at once.
+        if dedup.is_duplicate(update["update_id"]):
             return JsonResponse({"status": "ok"})
+
+        try:
+            work_queue.enqueue(update)
+        except Exception as e:
+            # QueueFull, or the queue database locked or unwritable.
+            print(f"Could not queue update {update['update_id']}: {e}")
+            dedup.forget(update["update_id"])
+            # Telegram retries non-2xx responses, so the update is not lost.
+            return JsonResponse({"status": "busy"}, status=503)
+        return JsonResponse({"status": "ok"})
     return JsonResponse({"status": "error"}, status=400)
 
+def metrics_view(request):
+    return JsonResponse(metrics.snapshot())
+
 def set_webhook_route(request):
     return JsonResponse(set_webhook())
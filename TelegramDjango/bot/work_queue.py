@@ -0,0 +1,187 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import metrics, telegram
+
+QUEUE_DB = os.getenv("BOT_QUEUE_DB", str(settings.BASE_DIR / "queue.sqlite3"))
+QUEUE_WORKERS = int(os.getenv("BOT_QUEUE_WORKERS", "4"))
+QUEUE_MAX_DEPTH = int(os.getenv("BOT_QUEUE_MAX_DEPTH", "1000"))
+# A job claimed by a worker that died is handed out again after this long.
+QUEUE_LEASE_SECONDS = float(os.getenv("BOT_QUEUE_LEASE_SECONDS", "300"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("BOT_QUEUE_MAX_ATTEMPTS", "3"))
+
+_local = threading.local()
+_wakeup = threading.Condition()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(QUEUE_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                enqueued_at REAL NOT NULL,
+                leased_until REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        _local.conn = conn
+    return conn
+
+
+def depth():
+    """Returns the number of jobs waiting or in progress."""
+    return _connect().execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def enqueue(update, claim=False):
+    """Durably stores an update and returns its job id.
+
+    By default a worker is woken to process it. With claim=True the caller
+    processes it itself and must call finish() or fail(); workers only pick
+    it up if that has not happened when the lease runs out (e.g. after a
+    restart).
+    """
+    conn = _connect()
+    current_depth = depth()
+    metrics.set_gauge("queue.depth", current_depth)
+    if current_depth >= QUEUE_MAX_DEPTH:
+        metrics.incr("queue.rejected")
+        raise QueueFull(f"Work queue is full ({current_depth} jobs)")
+
+    now = time.time()
+    cursor = conn.execute(
+        "INSERT INTO jobs (payload, enqueued_at, attempts, leased_until) VALUES (?, ?, ?, ?)",
+        (json.dumps(update), now, 1 if claim else 0, now + QUEUE_LEASE_SECONDS if claim else 0),
+    )
+    metrics.incr("queue.enqueued")
+    start_workers()
+    if not claim:
+        with _wakeup:
+            _wakeup.notify()
+    return cursor.lastrowid
+
+
+def _claim():
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, payload, attempts, enqueued_at FROM jobs "
+            "WHERE leased_until < ? ORDER BY id LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row:
+            conn.execute(
+                "UPDATE jobs SET leased_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (now + QUEUE_LEASE_SECONDS, row[0]),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def finish(job_id):
+    """Removes a job that has been processed."""
+    _connect().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+def _release(job_id, attempts):
+    conn = _connect()
+    if attempts >= QUEUE_MAX_ATTEMPTS:
+        print(f"Dropping job {job_id} after {attempts} attempts")
+        metrics.incr("queue.dropped")
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+    else:
+        # Back off before the next attempt so a failing upstream is not hammered.
+        conn.execute(
+            "UPDATE jobs SET leased_until = ? WHERE id = ?",
+            (time.time() + 2 ** attempts, job_id),
+        )
+
+
+def fail(job_id, attempts, delivery):
+    """Retries a failed job, unless it already replied to the user (a retry would reply, and bill, twice)."""
+    if delivery["sent"]:
+        print(f"Not retrying job {job_id}: the user already got a reply")
+        metrics.incr("queue.failed_after_reply")
+        finish(job_id)
+    else:
+        _release(job_id, attempts)
+
+
+def _worker_loop(handler):
+    while True:
+        try:
+            job = _claim()
+        except sqlite3.OperationalError as e:
+            print(f"Work queue claim failed: {e}")
+            job = None
+
+        if job is None:
+            with _wakeup:
+                _wakeup.wait(timeout=1.0)
+            continue
+
+        job_id, payload, attempts, enqueued_at = job
+        if attempts >= QUEUE_MAX_ATTEMPTS:
+            _release(job_id, attempts)
+            continue
+        metrics.observe("queue.wait", time.time() - enqueued_at)
+        close_old_connections()
+        delivery = telegram.track_delivery()
+        try:
+            with metrics.stage("total"):
+                handler(json.loads(payload))
+            finish(job_id)
+            metrics.incr("queue.processed")
+        except Exception as e:
+            print(f"Error processing job {job_id}: {e}")
+            metrics.incr("queue.failed")
+            fail(job_id, attempts + 1, delivery)
+        finally:
+            close_old_connections()
+            metrics.set_gauge("queue.depth", depth())
+
+
+def start_workers(handler=None):
+    """Starts the worker pool once per process (from BotConfig.ready, or the first enqueue)."""
+    with _workers_lock:
+        if _workers:
+            return
+        if handler is None:
+            from .views import process_update as handler
+        for i in range(QUEUE_WORKERS):
+            thread = threading.Thread(
+                target=_worker_loop, args=(handler,), name=f"bot-worker-{i}", daemon=True
+            )
+            thread.start()
+            _workers.append(thread)
+        metrics.set_gauge("queue.workers", len(_workers))
+
+    # Jobs left over from before a restart are claimed straight away.
+    backlog = depth()
+    metrics.set_gauge("queue.depth", backlog)
+    if backlog:
+        print(f"Work queue resuming with {backlog} jobs")
+    with _wakeup:
+        _wakeup.notify_all()
@@ -14,12 +14,22 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import sys
+
 from django.contrib import admin
 from django.urls import path
-from bot.views import webhook, set_webhook_route
+from bot.views import webhook, set_webhook_route, metrics_view
 
 urlpatterns = [
     path("", set_webhook_route, name="set_webhook"),
     path("webhook/", webhook, name="webhook"),
+    path("metrics/", metrics_view, name="metrics"),
     path('admin/', admin.site.urls),
 ]
+
+# Point Telegram here when serving through telegram_bot.asgi. Under WSGI the
+# event loop ends with each response, so the async webhook is not mounted.
+if "telegram_bot.asgi" in sys.modules:
+    from bot import async_views
+
+    urlpatterns.append(path("webhook/async/", async_views.webhook, name="webhook_async"))
@@ -1,9 +1,12 @@
 from flask import Flask, request, Response, render_template_string, jsonify
+import os
 import sqlite3
 from groq import Groq
 
 app = Flask(__name__)
 DATABASE = "chats.db"
+# Uploads above this size are rejected with 413 before they are read.
+app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
 
 def init_db():
     """Initialize the SQLite database and create the chats table if needed."""
@@ -111,12 +114,12 @@ def transcribe():
     if file.filename == '':
         return jsonify({'error': 'No selected file.'}), 400
 
-    # Read the file content as bytes.
-    file_content = file.read()
+    # Pass the upload stream through instead of reading it into memory;
+    # Werkzeug spools large uploads to a temporary file.
     filename = file.filename
 
     transcription = client.audio.transcriptions.create(
-        file=(filename, file_content),
+        file=(filename, file.stream),
         model="whisper-large-v3",
         response_format="verbose_json",
     )
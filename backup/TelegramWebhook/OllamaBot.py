@@ -1,4 +1,4 @@
-import requests, os, subprocess
+import requests, os, threading
 from flask import Flask, request, jsonify
 
 app = Flask(__name__)
@@ -12,6 +12,19 @@ if not BOT_TOKEN:
 
 BASE_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
 
+# Long-running Ollama server; the model stays loaded between messages for OLLAMA_KEEP_ALIVE.
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:1b")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+# Requests sent to Ollama at once; match the server's OLLAMA_NUM_PARALLEL.
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+
+# One pooled keep-alive connection per worker instead of a new process per message.
+ollama_session = requests.Session()
+ollama_session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=OLLAMA_MAX_CONCURRENCY))
+ollama_slots = threading.BoundedSemaphore(OLLAMA_MAX_CONCURRENCY)
+
 # Webhook URL (Replace with your actual HTTPS URL)
 WEBHOOK_URL = "https://monkey-related-kangaroo.ngrok-free.app/webhook"
 
@@ -30,14 +43,21 @@ def send_message(chat_id, text):
 # Function to generate AI-based reply using Ollama
 def generate_reply(message_text):
     try:
-        process = subprocess.run(
-            ["ollama", "run", "llama3.2:1b"],
-            input=message_text,
-            text=True,
-            capture_output=True
-        )
-        return process.stdout.strip()
+        with ollama_slots:
+            response = ollama_session.post(
+                f"{OLLAMA_URL}/api/chat",
+                json={
+                    "model": OLLAMA_MODEL,
+                    "messages": [{"role": "user", "content": message_text}],
+                    "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
+                },
+                timeout=(2, OLLAMA_TIMEOUT),
+            )
+        response.raise_for_status()
+        return response.json()["message"]["content"].strip()
     except Exception as e:
+        print(f"Error in Ollama reply: {e}")
         return "Sorry, I'm having trouble processing your request."
 
 # Webhook endpoint to receive messages
@@ -1,118 +1,144 @@
-from flask import Flask, render_template, request
-import requests
-from bs4 import BeautifulSoup
-import xml.etree.ElementTree as ET
-import faiss
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-GUI backend for Matplotlib
-import matplotlib.pyplot as plt
-from sentence_transformers import SentenceTransformer
-from sklearn.decomposition import PCA
-from mpl_toolkits.mplot3d import Axes3D
+from flask import Flask, jsonify, render_template, request
 import os
 import json
-from groq import Groq
-
+import threading
+import time
+import visualise
+
+# Heavy libraries (faiss, sentence_transformers, groq, and matplotlib and
+# scikit-learn in visualise.py) are imported inside the functions that use
+# them, so importing this module is cheap and the model and index load on a
+# background thread; see profile_startup.py.
 app = Flask(__name__)
 SCRAPED_DATA_FILE = "static/scraped_data.json"
+# Documents retrieved per question.
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
 
-# Step 1: Extract URLs from the Sitemap
-sitemap_url = 'https://blogforge.pythonanywhere.com/sitemap.xml'
+# Seconds between background re-crawls of the sitemap (0 crawls once, at start-up).
+SCRAPE_REFRESH_SECONDS = float(os.getenv("SCRAPE_REFRESH_SECONDS", "0"))
+# Start loading the model and index as soon as the module is imported (0 waits for the first request).
+EAGER_WARM_UP = os.getenv("APP_EAGER_WARM_UP", "1") == "1"
+# Draw the embedding plot when the form does not say (the "graph" checkbox opts in per question).
+GRAPH_DEFAULT = os.getenv("RAG_GRAPH_DEFAULT", "0") == "1"
+# Seconds a question waits for the warm-up before the page asks to try again.
+READY_TIMEOUT = float(os.getenv("APP_READY_TIMEOUT", "20"))
+
+WARMING_UP_REPLY = "The assistant is still starting up, please try again in a few seconds."
 
-# Step 2: Fetch Meta Descriptions
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-}
+# Set by warm_up(); requests check _ready before touching them.
+model = None
+store = None
+default_options = []
+client = None
+
+_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up = {"thread": None, "error": None, "seconds": None}
 
 def fetch_meta_descriptions():
-    if os.path.exists(SCRAPED_DATA_FILE):
+    """Pages from the last crawl, and whether they had to be crawled now (only on the very first start)."""
+    import scraper
+
+    data = scraper.cached_pages()
+    if not data and os.path.exists(SCRAPED_DATA_FILE):
         with open(SCRAPED_DATA_FILE, "r") as file:
-            return json.load(file)
-    
-    response = requests.get(sitemap_url)
-    sitemap_xml = response.content
-    root = ET.fromstring(sitemap_xml)
-    namespace = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
-    urls = [url.find('ns:loc', namespace).text for url in root.findall('ns:url', namespace)]
-    
-    data = {}
-    for url in urls:
-        try:
-            page_response = requests.get(url, headers=headers)
-            if page_response.status_code == 200:
-                soup = BeautifulSoup(page_response.text, 'html.parser')
-                blog_details = soup.find(class_="blog-details")
-                
-                if blog_details:
-                    data[url] = blog_details.get_text(strip=True)
-                else:
-                    description_tag = soup.find('meta', attrs={'name': 'description'})
-                    data[url] = description_tag['content'] if description_tag and 'content' in description_tag.attrs else 'No meta description found'
-            else:
-                data[url] = f'Error: {page_response.status_code}'
-                
-            print(data[url])
-        except Exception as e:
-            data[url] = f'Error fetching {url}: {str(e)}'
-    
-    with open(SCRAPED_DATA_FILE, "w") as file:
-        json.dump(data, file)
-    
-    return data
-
-default_options = list(set(fetch_meta_descriptions().values()))
-
-# Load the embedding model
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-# Function to generate embeddings, find similarity, and plot graph
-def generate_graph(question, documents):
-    all_texts = [question] + documents
-    embeddings = model.encode(all_texts)
-    embeddings = np.array(embeddings).astype('float32')
-
-    pca = PCA(n_components=3)
-    reduced_embeddings = pca.fit_transform(embeddings)
-
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings[1:])
-
-    query_embedding = np.array([embeddings[0]]).astype('float32')
-    distances, indices = index.search(query_embedding, len(documents))
-    index_distance_map = {idx: dist for dist, idx in zip(distances[0], indices[0])}
-    best_match_index = min(index_distance_map, key=index_distance_map.get)
-
-    fig = plt.figure(figsize=(6, 5))
-    ax = fig.add_subplot(111, projection='3d')
-    q_x, q_y, q_z = reduced_embeddings[0]
-    ax.scatter(q_x, q_y, q_z, color='red', label="Question", s=100)
-    ax.text(q_x, q_y, q_z, "Q", fontsize=10, color='black', fontweight='bold')
-    
-    doc_points = reduced_embeddings[1:]
-    for i, (x, y, z) in enumerate(doc_points):
-        ax.scatter(x, y, z, color='blue')
-        ax.text(x, y, z, f"O{i+1}", fontsize=10)
-        line_color = 'green' if i == best_match_index else 'red'
-        ax.plot([q_x, x], [q_y, y], [q_z, z], linestyle='--', color=line_color)
-
-    ax.set_title("3D Visualization of Question and Option Embeddings")
-    ax.set_xlabel("PCA 1")
-    ax.set_ylabel("PCA 2")
-    ax.set_zlabel("PCA 3")
-
-    graph_path = "static/graph.png"
-    plt.savefig(graph_path)
-    plt.close()
-    return documents[best_match_index], graph_path
+            data = json.load(file)
+    if data:
+        return data, False
+    data, _ = scraper.scrape()
+    scraper.write_snapshot(data, SCRAPED_DATA_FILE)
+    return data, True
+
+def refresh_corpus(crawl_now=True):
+    """Re-crawls changed pages in the background and swaps in the updated index."""
+    global store, default_options
+    import rag_index
+    import scraper
+
+    while True:
+        if crawl_now:
+            try:
+                data, changed = scraper.scrape()
+                scraper.write_snapshot(data, SCRAPED_DATA_FILE)
+                if rag_index.corpus_version(rag_index.corpus_documents(data)) != store.version:
+                    store = rag_index.load_or_build(data, model)
+                    default_options = store.documents
+            except Exception as e:
+                print(f"Error refreshing the corpus: {e}")
+        crawl_now = True
+        if SCRAPE_REFRESH_SECONDS <= 0:
+            return
+        time.sleep(SCRAPE_REFRESH_SECONDS)
+
+def groq_client():
+    global client
+    if client is None:
+        from groq import Groq
+        client = Groq(api_key=GROQ_API_KEY)
+    return client
+
+def warm_up():
+    """Loads the embedding model and the index, then keeps the corpus fresh."""
+    global model, store, default_options
+    start = time.monotonic()
+    try:
+        import rag_index
+        from sentence_transformers import SentenceTransformer
+
+        # Load the embedding model
+        model = SentenceTransformer(rag_index.EMBEDDING_MODEL)
+        # Documents are embedded once (see rag_index.py); requests only embed the question.
+        data, crawled = fetch_meta_descriptions()
+        store = rag_index.load_or_build(data, model)
+        default_options = store.documents
+        # The first encode allocates the model's buffers; pay for it here, not in a request.
+        model.encode(["warm-up"])
+        groq_client()
+    except Exception as e:
+        _warm_up["error"] = str(e)
+        print(f"Warm-up failed: {e}")
+        return
+    _warm_up["seconds"] = round(time.monotonic() - start, 2)
+    _ready.set()
+    print(f"Ready in {_warm_up['seconds']}s with {len(store.documents)} documents")
+
+    # Not needed to answer, so imported and fitted after the app reports ready.
+    try:
+        visualise.basis(store)
+    except Exception as e:
+        print(f"Error preparing the graph basis: {e}")
+    # A first start has just crawled the sitemap; the next crawl waits for the interval.
+    refresh_corpus(crawl_now=not crawled)
+
+def start_warm_up():
+    """Starts warm_up() on a background thread, unless it is running or done; a failed one is retried."""
+    with _warm_up_lock:
+        thread = _warm_up["thread"]
+        if _ready.is_set() or (thread is not None and thread.is_alive()):
+            return
+        _warm_up["error"] = None
+        _warm_up["thread"] = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+        _warm_up["thread"].start()
+
+# Function to embed the question and find the nearest documents
+def find_best_match(question, store):
+    """Returns (best document, its row, the question's embedding); the first two are None if nothing matched."""
+    import numpy as np
+
+    query_embedding = np.asarray(model.encode([question]), dtype='float32')
+    # search() drops the -1 ids IVF/PQ return when the probed lists are empty.
+    matches = [(row, distance) for row, distance in store.search(query_embedding, RAG_TOP_K)
+               if 0 <= row < len(store.documents)]
+    if not matches:
+        return None, None, query_embedding
+    best_match_index = matches[0][0]
+    return store.documents[best_match_index], best_match_index, query_embedding
 
 def generate_reply(message_text):
     try:
-        completion = client.chat.completions.create(
+        completion = groq_client().chat.completions.create(
             model="llama-3.2-1b-preview",
             messages=[{"role": "user", "content": message_text}],
             temperature=1,
@@ -128,13 +154,48 @@ def generate_reply(message_text):
 def index():
     correct_answer = None
     graph_url = None
+    graph_key = None
     if request.method == 'POST':
+        start_warm_up()
+        if not _ready.wait(READY_TIMEOUT):
+            return render_template('index.html', correct_answer=WARMING_UP_REPLY, graph_url=None), 503
         question = request.form['question']
-        correct_answer, graph_url = generate_graph(question, default_options)
+        current_store = store
+        correct_answer, best_match_index, query_embedding = find_best_match(question, current_store)
+        if correct_answer is None:
+            # No context found; answer the question on its own.
+            return render_template('index.html', correct_answer=generate_reply(question), graph_url=None, graph_key=None)
+        if request.form.get('graph', 'on' if GRAPH_DEFAULT else '') == 'on':
+            # Drawn by visualise's workers while the reply is generated; the page polls /graph/<key>.
+            graph_key = visualise.submit(question, query_embedding, best_match_index, current_store)
+            graph_url = visualise.graph_path(graph_key)
         
         prompt = f'{question} \n Write in 50 words short reply based on\n {correct_answer}'
         correct_answer = generate_reply(prompt)
-    return render_template('index.html', correct_answer=correct_answer, graph_url=graph_url)
+    return render_template('index.html', correct_answer=correct_answer, graph_url=graph_url, graph_key=graph_key)
+
+@app.route('/graph/<key>')
+def graph(key):
+    """Whether a requested plot has been drawn yet: 200 when it has, 202 while it is queued, 404 otherwise."""
+    if not all(c in "0123456789abcdef" for c in key):
+        return jsonify(status="missing"), 404
+    status = visualise.status(key)
+    codes = {"ready": 200, "pending": 202, "missing": 404}
+    return jsonify(status=status, url="/" + visualise.graph_path(key)), codes[status]
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the model and index are loaded, 503 until then (a failed warm-up is retried)."""
+    error = _warm_up["error"]
+    start_warm_up()
+    if _ready.is_set():
+        return jsonify(status="ready", documents=len(store.documents), warm_up_seconds=_warm_up["seconds"])
+    if error:
+        return jsonify(status="failed", error=error), 503
+    return jsonify(status="warming up"), 503
+
+if EAGER_WARM_UP:
+    start_warm_up()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,95 @@
+# Recall@k and query latency of each rag_index index type against the exact flat index.
+#   python bench_rag_index.py --count 100000          # synthetic clustered vectors
+#   python bench_rag_index.py --index-dir static/rag_index   # the built corpus
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+import rag_index
+
+
+def synthetic_vectors(count, dimension, clusters=200, seed=0):
+    """Clustered unit vectors, closer to sentence embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype("float32")
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.3 * rng.standard_normal((count, dimension)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors, dtype="float32")
+
+
+def index_bytes(index):
+    with tempfile.NamedTemporaryFile(delete=False) as file:
+        path = file.name
+    try:
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def recall_at_k(found, truth, k):
+    hits = sum(len(set(row[:k]) & set(expected[:k])) for row, expected in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def query_latencies(index, queries, k):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query.reshape(1, -1), k)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rag_index index types against exact search.")
+    parser.add_argument("--index-dir", help="Benchmark the vectors of a built store instead of synthetic data")
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default=",".join(rag_index.INDEX_TYPES))
+    args = parser.parse_args()
+
+    if args.index_dir:
+        store = rag_index.load(args.index_dir)
+        vectors = np.ascontiguousarray(store.vectors, dtype="float32")
+    else:
+        vectors = synthetic_vectors(args.count, args.dimension)
+    # Queries are perturbed corpus vectors, so every query has true neighbours.
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, len(vectors), args.queries)
+    queries = vectors[picks] + 0.05 * rng.standard_normal((args.queries, vectors.shape[1])).astype("float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    k = min(args.k, len(vectors))
+
+    flat = faiss.IndexFlatL2(vectors.shape[1])
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+
+    print(f"{len(vectors)} vectors, dimension {vectors.shape[1]}, {args.queries} queries, k={k}")
+    print(f"{'type':>9} {'build s':>8} {'MB':>8} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for index_type in args.types.split(","):
+        params = rag_index.index_params(index_type)
+        start = time.perf_counter()
+        index, params = rag_index.make_index(vectors, params)
+        build_seconds = time.perf_counter() - start
+        rag_index.set_search_params(index, params)
+
+        _, found = index.search(queries, k)
+        timings = sorted(query_latencies(index, queries, k))
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(
+            f"{params['index_type']:>9} {build_seconds:>8.2f} {index_bytes(index) / 1e6:>8.1f} "
+            f"{recall_at_k(found, truth, k):>9.3f} {statistics.median(timings) * 1000:>8.3f} {p99 * 1000:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# Start-up profile of app.py: what importing it costs, and how long the
+# background warm-up takes until /ready answers 200.
+#   python profile_startup.py              # import profile and time to ready
+#   python profile_startup.py --top 30 --no-ready
+# Run it against an older app.py (git stash) to compare.
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_profile(module):
+    """Runs ``import module`` under -X importtime in a fresh interpreter; returns (wall seconds, rows).
+
+    Each row is (cumulative microseconds, self microseconds, depth, package).
+    """
+    # Warm-up off, so only the import itself is measured.
+    env = dict(os.environ, APP_EAGER_WARM_UP="0")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+    return wall, rows
+
+
+def time_to_ready(module, timeout):
+    """Imports module in a fresh interpreter and polls its /ready until it returns 200."""
+    script = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "imported = time.perf_counter() - start\n"
+        f"client = {module}.app.test_client()\n"
+        f"while time.perf_counter() - start < {timeout}:\n"
+        "    response = client.get('/ready')\n"
+        "    if response.status_code == 200:\n"
+        "        break\n"
+        "    time.sleep(0.1)\n"
+        "print(imported, time.perf_counter() - start, response.status_code, response.get_data(as_text=True).strip())\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+    imported, ready, status, body = result.stdout.strip().splitlines()[-1].split(" ", 3)
+    return float(imported), float(ready), int(status), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the start-up of app.py.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=15, help="Top-level imports to list, by cumulative time")
+    parser.add_argument("--no-ready", action="store_true", help="Skip the time-to-ready measurement")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    wall, rows = import_profile(args.module)
+    # Rows are printed children first, so the module's own imports are the
+    # depth-1 rows between it and the previous top-level row.
+    end = next(i for i, row in enumerate(rows) if row[3] == args.module and row[2] == 0)
+    begin = end
+    while begin > 0 and rows[begin - 1][2] > 0:
+        begin -= 1
+    direct = [row for row in rows[begin:end] if row[2] == 1]
+    print(f"import {args.module}: {rows[end][0] / 1e6:.3f}s of imports, {wall:.3f}s including interpreter start")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  package")
+    for cumulative_us, self_us, _, name in sorted(direct, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    if not args.no_ready:
+        imported, ready, status, body = time_to_ready(args.module, args.timeout)
+        print(f"\nimported in {imported:.3f}s, /ready returned {status} after {ready:.2f}s: {body}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# Offline embedding index for app.py. Build it once after scraping with
+#   python rag_index.py --scraped static/scraped_data.json
+# (app.py also builds it on start-up if it is missing or the corpus changed,
+# and appends new posts without a rebuild).
+import argparse
+import hashlib
+import json
+import math
+import os
+
+import faiss
+import numpy as np
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+INDEX_DIR = os.getenv("RAG_INDEX_DIR", "static/rag_index")
+INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.f32"
+META_FILE = "documents.json"
+ENCODE_BATCH_SIZE = int(os.getenv("RAG_ENCODE_BATCH_SIZE", "64"))
+
+# flat (exact), ivf_flat, hnsw or ivf_pq (compressed).
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+# IVF: number of clusters (0 picks about 4 * sqrt(n)) and clusters visited per query.
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+# HNSW: links per node, and candidate list sizes while building and searching.
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "40"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+# PQ: sub-quantizers (must divide the dimension) and bits per code.
+PQ_M = int(os.getenv("RAG_PQ_M", "16"))
+PQ_NBITS = int(os.getenv("RAG_PQ_NBITS", "8"))
+# Trained indexes need enough vectors per centroid; smaller corpora stay flat.
+MIN_POINTS_PER_CENTROID = 39
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+
+def corpus_documents(scraped):
+    """Unique page texts in a stable order (app.py used list(set(...)), whose order changes per run)."""
+    return list(dict.fromkeys(scraped.values()))
+
+
+def corpus_version(documents, model_name=EMBEDDING_MODEL):
+    digest = hashlib.sha256(model_name.encode())
+    # Order-independent, so documents appended by add() match a fresh scrape.
+    for document in sorted(documents):
+        digest.update(document.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def index_params(index_type=INDEX_TYPE, nlist=IVF_NLIST, nprobe=IVF_NPROBE, hnsw_m=HNSW_M,
+                 ef_construction=HNSW_EF_CONSTRUCTION, ef_search=HNSW_EF_SEARCH,
+                 pq_m=PQ_M, pq_nbits=PQ_NBITS):
+    return {
+        "index_type": index_type, "nlist": nlist, "nprobe": nprobe, "hnsw_m": hnsw_m,
+        "ef_construction": ef_construction, "ef_search": ef_search,
+        "pq_m": pq_m, "pq_nbits": pq_nbits,
+    }
+
+
+def make_index(vectors, params):
+    """Creates, trains and fills an index of params["index_type"] over vectors."""
+    count, dimension = vectors.shape
+    index_type = params["index_type"]
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    nlist = params["nlist"] or max(1, int(4 * math.sqrt(count)))
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = min(nlist, count // MIN_POINTS_PER_CENTROID)
+        if nlist < 1 or (index_type == "ivf_pq" and count < 2 ** params["pq_nbits"]):
+            print(f"{count} vectors are too few to train {index_type}, using flat")
+            index_type = "flat"
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, params["pq_m"], params["pq_nbits"])
+        index.train(vectors)
+
+    index.add(vectors)
+    return index, dict(params, index_type=index_type, nlist=nlist, trained_on=count)
+
+
+def set_search_params(index, params):
+    """Applies the query-time knobs, which FAISS does not store in the index file."""
+    space = faiss.ParameterSpace()
+    if params["index_type"] in ("ivf_flat", "ivf_pq"):
+        space.set_index_parameter(index, "nprobe", params["nprobe"])
+    elif params["index_type"] == "hnsw":
+        space.set_index_parameter(index, "efSearch", params["ef_search"])
+
+
+class Store:
+    """Documents, their memory-mapped vectors and the FAISS index over them."""
+
+    def __init__(self, index_dir, documents, vectors, index, version, params):
+        self.index_dir = index_dir
+        self.documents = documents
+        self.vectors = vectors
+        self.index = index
+        self.version = version
+        self.params = params
+
+    def search(self, query_vector, k=3):
+        """Returns [(document index, distance)] for up to k nearest documents; IVF/PQ may find fewer, or none."""
+        query = np.asarray(query_vector, dtype="float32").reshape(1, -1)
+        k = min(k, len(self.documents))
+        if k <= 0:
+            return []
+        distances, indices = self.index.search(query, k)
+        return [(int(i), float(d)) for d, i in zip(distances[0], indices[0]) if i != -1]
+
+
+def _encode(documents, model):
+    embeddings = model.encode(documents, batch_size=ENCODE_BATCH_SIZE, show_progress_bar=False)
+    return np.ascontiguousarray(embeddings, dtype="float32")
+
+
+def _reuse_or_encode(documents, model, previous):
+    """Embeds only the documents the previous build did not have; the rest are copied over."""
+    old_rows = {}
+    if previous is not None:
+        old_rows = {document: row for row, document in enumerate(previous.documents)}
+    missing = [document for document in documents if document not in old_rows]
+    if previous is not None:
+        print(f"Re-embedding {len(missing)} of {len(documents)} documents")
+    encoded = iter(_encode(missing, model)) if missing else iter(())
+    rows = []
+    for document in documents:
+        if document in old_rows:
+            # Copy out of the memory map before the vectors file is rewritten.
+            rows.append(np.array(previous.vectors[old_rows[document]]))
+        else:
+            rows.append(next(encoded))
+    return np.ascontiguousarray(np.vstack(rows), dtype="float32")
+
+
+def _write_index(index, path):
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def _write_meta(index_dir, documents, dimension, params):
+    meta = {
+        "model": EMBEDDING_MODEL,
+        "version": corpus_version(documents),
+        "dimension": int(dimension),
+        "params": params,
+        "documents": documents,
+    }
+    meta_path = os.path.join(index_dir, META_FILE)
+    with open(meta_path + ".tmp", "w") as file:
+        json.dump(meta, file)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def build(scraped, model, index_dir=INDEX_DIR, params=None):
+    """Embeds the scraped documents (reusing vectors of unchanged ones) and writes the index, vectors and metadata."""
+    params = params or index_params()
+    documents = corpus_documents(scraped)
+    embeddings = _reuse_or_encode(documents, model, load(index_dir))
+    meta_path = os.path.join(index_dir, META_FILE)
+    if os.path.exists(meta_path):
+        # Invalidate the old build before its files are overwritten.
+        os.remove(meta_path)
+
+    os.makedirs(index_dir, exist_ok=True)
+    vectors_path = os.path.join(index_dir, VECTORS_FILE)
+    vectors = np.memmap(vectors_path + ".tmp", dtype="float32", mode="w+", shape=embeddings.shape)
+    vectors[:] = embeddings
+    vectors.flush()
+    del vectors
+    # Replaced rather than rewritten, so a store still mapping the old files keeps working.
+    os.replace(vectors_path + ".tmp", vectors_path)
+
+    index, params = make_index(embeddings, params)
+    _write_index(index, os.path.join(index_dir, INDEX_FILE))
+    # Written last, so a build that dies halfway is never loaded.
+    _write_meta(index_dir, documents, embeddings.shape[1], params)
+    return load(index_dir)
+
+
+def add(documents, model, index_dir=INDEX_DIR):
+    """Appends new documents to a built store without retraining or re-embedding the rest.
+
+    IVF centroids stay those of the original build, so rebuild once the
+    corpus has grown well past what it was trained on.
+    """
+    store = load(index_dir, mmap=False)
+    known = set(store.documents)
+    new_documents = [document for document in dict.fromkeys(documents) if document not in known]
+    if not new_documents:
+        return store
+
+    embeddings = _encode(new_documents, model)
+    # Vectors, then metadata, then the index: a crash part-way leaves at worst an
+    # index short of some documents, which load() re-indexes from the vectors.
+    with open(os.path.join(index_dir, VECTORS_FILE), "r+b") as file:
+        # Drop rows an interrupted add() wrote past the documents, so the new
+        # rows line up with their documents.
+        file.truncate(len(store.documents) * embeddings.shape[1] * 4)
+        file.seek(0, os.SEEK_END)
+        file.write(embeddings.tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+    params = store.params
+    all_documents = store.documents + new_documents
+    if params.get("trained_on") and len(all_documents) > 4 * params["trained_on"]:
+        print(f"Index trained on {params['trained_on']} vectors now holds {len(all_documents)}; consider a rebuild")
+    _write_meta(index_dir, all_documents, embeddings.shape[1], params)
+
+    store.index.add(embeddings)
+    _write_index(store.index, os.path.join(index_dir, INDEX_FILE))
+    return load(index_dir)
+
+
+def load(index_dir=INDEX_DIR, mmap=True):
+    """Opens a built store, or returns None if there is none."""
+    meta_path = os.path.join(index_dir, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as file:
+        meta = json.load(file)
+
+    documents = meta["documents"]
+    params = meta.get("params") or index_params("flat")
+    vectors_path = os.path.join(index_dir, VECTORS_FILE)
+    if os.path.getsize(vectors_path) < len(documents) * meta["dimension"] * 4:
+        print("Stored vectors are missing rows, the embedding index will be rebuilt")
+        return None
+    vectors = np.memmap(vectors_path, dtype="float32", mode="r", shape=(len(documents), meta["dimension"]))
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    index = None
+    if mmap:
+        try:
+            # Map the index file instead of reading it into memory where FAISS supports it.
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    if index is None:
+        index = faiss.read_index(index_path)
+    if index.ntotal != len(documents):
+        # An add() stopped between the metadata and the index; ids past the
+        # documents would make searches fail.
+        print(f"Index holds {index.ntotal} vectors for {len(documents)} documents, re-indexing the stored vectors")
+        index, params = make_index(np.ascontiguousarray(vectors, dtype="float32"), params)
+        _write_index(index, index_path)
+        _write_meta(index_dir, documents, meta["dimension"], params)
+    set_search_params(index, params)
+    return Store(index_dir, documents, vectors, index, meta["version"], params)
+
+
+def load_or_build(scraped, model, index_dir=INDEX_DIR, params=None):
+    """Loads the store, adding new posts in place and rebuilding only when posts changed or were removed."""
+    params = params or index_params()
+    documents = corpus_documents(scraped)
+    store = load(index_dir)
+    if store is not None and store.version == corpus_version(documents):
+        return store
+    if (store is not None and store.params["index_type"] == params["index_type"]
+            and set(store.documents) <= set(documents)):
+        print("Adding new documents to the embedding index...")
+        return add(documents, model, index_dir)
+    print("Building the embedding index...")
+    return build(scraped, model, index_dir, params)
+
+
+if __name__ == "__main__":
+    from sentence_transformers import SentenceTransformer
+
+    parser = argparse.ArgumentParser(description="Embed the scraped corpus and write the FAISS index.")
+    parser.add_argument("--scraped", default="static/scraped_data.json")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--add", action="store_true", help="Append new documents instead of rebuilding")
+    args = parser.parse_args()
+
+    with open(args.scraped) as file:
+        scraped = json.load(file)
+    model = SentenceTransformer(EMBEDDING_MODEL)
+    if args.add and load(args.index_dir) is not None:
+        store = add(corpus_documents(scraped), model, args.index_dir)
+    else:
+        store = build(scraped, model, args.index_dir, index_params(args.index_type))
+    print(f"Indexed {len(store.documents)} documents into {args.index_dir} "
+          f"({store.params['index_type']}, version {store.version})")
@@ -0,0 +1,181 @@
+# Incremental sitemap crawler for app.py. Per-URL state (validators, lastmod
+# and the extracted text) lives in a small SQLite file, so a re-run only
+# downloads pages that changed.
+#   python scraper.py
+import json
+import os
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from bs4 import BeautifulSoup
+
+SITEMAP_URL = os.getenv("SCRAPE_SITEMAP_URL", "https://blogforge.pythonanywhere.com/sitemap.xml")
+STATE_DB = os.getenv("SCRAPE_STATE_DB", "static/scrape_state.sqlite3")
+SCRAPE_WORKERS = int(os.getenv("SCRAPE_WORKERS", "8"))
+SCRAPE_CONNECT_TIMEOUT = float(os.getenv("SCRAPE_CONNECT_TIMEOUT", "5"))
+SCRAPE_READ_TIMEOUT = float(os.getenv("SCRAPE_READ_TIMEOUT", "20"))
+
+SITEMAP_NAMESPACE = {'ns': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+}
+
+
+def make_session(workers=SCRAPE_WORKERS):
+    """One keep-alive connection per worker, reused across pages."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers)
+    return session
+
+
+def open_state(path=STATE_DB):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path)
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            lastmod TEXT,
+            text TEXT,
+            fetched_at REAL
+        )
+        """
+    )
+    return db
+
+
+def load_pages(db):
+    """Returns {url: text} for every page scraped so far."""
+    return {url: text for url, text in db.execute("SELECT url, text FROM pages ORDER BY url")}
+
+
+def cached_pages(path=STATE_DB):
+    """{url: text} from the last crawl, without touching the network ({} before the first one)."""
+    if not os.path.exists(path):
+        return {}
+    db = open_state(path)
+    try:
+        return load_pages(db)
+    finally:
+        db.close()
+
+
+def parse_sitemap(content):
+    """Returns [(url, lastmod or None)] from a sitemap document."""
+    root = ET.fromstring(content)
+    entries = []
+    for url in root.findall('ns:url', SITEMAP_NAMESPACE):
+        lastmod = url.find('ns:lastmod', SITEMAP_NAMESPACE)
+        entries.append((url.find('ns:loc', SITEMAP_NAMESPACE).text, lastmod.text if lastmod is not None else None))
+    return entries
+
+
+def extract_text(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    blog_details = soup.find(class_="blog-details")
+    if blog_details:
+        return blog_details.get_text(strip=True)
+    description_tag = soup.find('meta', attrs={'name': 'description'})
+    return description_tag['content'] if description_tag and 'content' in description_tag.attrs else 'No meta description found'
+
+
+def fetch_page(session, url, etag=None, last_modified=None):
+    """Conditional GET; returns (status, text, etag, last_modified), with text None when unchanged."""
+    request_headers = {}
+    if etag:
+        request_headers['If-None-Match'] = etag
+    if last_modified:
+        request_headers['If-Modified-Since'] = last_modified
+    try:
+        response = session.get(url, headers=request_headers, timeout=(SCRAPE_CONNECT_TIMEOUT, SCRAPE_READ_TIMEOUT))
+    except Exception as e:
+        return "error", f'Error fetching {url}: {str(e)}', None, None
+    if response.status_code == 304:
+        return "unchanged", None, etag, last_modified
+    if response.status_code != 200:
+        return "error", f'Error: {response.status_code}', None, None
+    return "changed", extract_text(response.text), response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+
+def scrape(sitemap_url=SITEMAP_URL, state_path=STATE_DB, workers=SCRAPE_WORKERS):
+    """Brings the state store up to date with the sitemap and returns ({url: text}, changed urls).
+
+    Pages whose sitemap lastmod matches the stored one are not requested at
+    all; the rest are fetched concurrently with If-None-Match/If-Modified-Since.
+    """
+    session = make_session(workers)
+    db = open_state(state_path)
+    try:
+        response = session.get(sitemap_url, timeout=(SCRAPE_CONNECT_TIMEOUT, SCRAPE_READ_TIMEOUT))
+        response.raise_for_status()
+        entries = parse_sitemap(response.content)
+
+        known = {
+            url: (etag, last_modified, lastmod, text)
+            for url, etag, last_modified, lastmod, text
+            in db.execute("SELECT url, etag, last_modified, lastmod, text FROM pages")
+        }
+        to_fetch = []
+        for url, lastmod in entries:
+            state = known.get(url)
+            if state and lastmod and state[2] == lastmod and state[3] is not None:
+                continue
+            to_fetch.append((url, lastmod, state))
+
+        changed = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(fetch_page, session, url, state and state[0], state and state[1]): (url, lastmod, state)
+                for url, lastmod, state in to_fetch
+            }
+            # SQLite writes stay on this thread; workers only do network and parsing.
+            for future in as_completed(futures):
+                url, lastmod, state = futures[future]
+                status, text, etag, last_modified = future.result()
+                if status == "unchanged":
+                    db.execute("UPDATE pages SET lastmod = ?, fetched_at = ? WHERE url = ?", (lastmod, time.time(), url))
+                    continue
+                if status == "error" and state and state[3] is not None:
+                    # Keep the last good copy rather than indexing an error message.
+                    print(text)
+                    continue
+                db.execute(
+                    "INSERT OR REPLACE INTO pages (url, etag, last_modified, lastmod, text, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, etag, last_modified, lastmod if status == "changed" else None, text, time.time()),
+                )
+                if not state or state[3] != text:
+                    changed.append(url)
+                print(text)
+
+        current = {url for url, _ in entries}
+        removed = [url for url in known if url not in current]
+        db.executemany("DELETE FROM pages WHERE url = ?", [(url,) for url in removed])
+        db.commit()
+        print(f"Scraped {len(to_fetch)} of {len(entries)} pages: {len(changed)} changed, {len(removed)} removed")
+        return load_pages(db), changed
+    finally:
+        db.close()
+        session.close()
+
+
+def write_snapshot(data, path):
+    """Writes the {url: text} JSON that rag_index.py and older tools read."""
+    with open(path + ".tmp", "w") as file:
+        json.dump(data, file)
+    os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    data, changed = scrape()
+    write_snapshot(data, "static/scraped_data.json")
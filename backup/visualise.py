@@ -0,0 +1,128 @@
+# 3D PCA plots of a question against the corpus for app.py. Plots are drawn
+# by a small worker pool, off the request path, into files named after the
+# corpus version and the question, so concurrent requests never share one and
+# a repeated question is not drawn twice.
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+GRAPH_DIR = os.getenv("RAG_GRAPH_DIR", "static/graphs")
+GRAPH_WORKERS = int(os.getenv("RAG_GRAPH_WORKERS", "2"))
+# Oldest plots are deleted once there are more than this many.
+GRAPH_MAX_FILES = int(os.getenv("RAG_GRAPH_MAX_FILES", "500"))
+# The PCA basis is fitted on at most this many corpus vectors.
+PCA_SAMPLE = int(os.getenv("RAG_GRAPH_PCA_SAMPLE", "10000"))
+
+_executor = ThreadPoolExecutor(max_workers=GRAPH_WORKERS, thread_name_prefix="graph")
+_pending = {}
+_pending_lock = threading.Lock()
+
+# Fitted once per corpus version: {"version", "pca", "points"}.
+_basis = {"version": None, "pca": None, "points": None}
+_basis_lock = threading.Lock()
+
+
+def plotting_modules():
+    """Matplotlib and scikit-learn, imported on first use (app.py also loads them after warm-up)."""
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-GUI backend for Matplotlib
+    from matplotlib.figure import Figure
+    from mpl_toolkits.mplot3d import Axes3D  # noqa: F401, registers the 3d projection
+    from sklearn.decomposition import PCA
+    return Figure, PCA
+
+
+def graph_key(version, question):
+    return hashlib.sha256(f"{version}\0{question}".encode()).hexdigest()[:24]
+
+
+def graph_path(key):
+    return os.path.join(GRAPH_DIR, f"{key}.png")
+
+
+def basis(store):
+    """The PCA fitted on store's vectors and the corpus projected onto it, reused until the corpus changes."""
+    import numpy as np
+    _, PCA = plotting_modules()
+
+    with _basis_lock:
+        if _basis["version"] != store.version:
+            vectors = np.asarray(store.vectors, dtype='float32')
+            sample = vectors
+            if len(vectors) > PCA_SAMPLE:
+                rows = np.random.default_rng(0).choice(len(vectors), PCA_SAMPLE, replace=False)
+                sample = vectors[np.sort(rows)]
+            pca = PCA(n_components=3).fit(sample)
+            _basis.update(version=store.version, pca=pca, points=pca.transform(vectors))
+        return _basis["pca"], _basis["points"]
+
+
+def render(path, query_embedding, best_match_index, store):
+    """Draws the question, the documents and their distances, and writes the PNG to path."""
+    Figure, _ = plotting_modules()
+    pca, doc_points = basis(store)
+    q_x, q_y, q_z = pca.transform(query_embedding.reshape(1, -1))[0]
+
+    # A Figure of its own rather than pyplot's global state, so workers can draw at once.
+    fig = Figure(figsize=(6, 5))
+    ax = fig.add_subplot(111, projection='3d')
+    ax.scatter(q_x, q_y, q_z, color='red', label="Question", s=100)
+    ax.text(q_x, q_y, q_z, "Q", fontsize=10, color='black', fontweight='bold')
+
+    for i, (x, y, z) in enumerate(doc_points):
+        ax.scatter(x, y, z, color='blue')
+        ax.text(x, y, z, f"O{i+1}", fontsize=10)
+        line_color = 'green' if i == best_match_index else 'red'
+        ax.plot([q_x, x], [q_y, y], [q_z, z], linestyle='--', color=line_color)
+
+    ax.set_title("3D Visualization of Question and Option Embeddings")
+    ax.set_xlabel("PCA 1")
+    ax.set_ylabel("PCA 2")
+    ax.set_zlabel("PCA 3")
+
+    os.makedirs(GRAPH_DIR, exist_ok=True)
+    # Written under a temporary name, so a poller never serves half a file.
+    fig.savefig(path + ".tmp", format="png")
+    os.replace(path + ".tmp", path)
+    prune()
+
+
+def prune(max_files=GRAPH_MAX_FILES):
+    paths = [os.path.join(GRAPH_DIR, name) for name in os.listdir(GRAPH_DIR) if name.endswith(".png")]
+    if len(paths) <= max_files:
+        return
+    paths.sort(key=lambda path: os.stat(path).st_mtime)
+    for path in paths[:len(paths) - max_files]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _render_logged(key, *args):
+    try:
+        render(graph_path(key), *args)
+    except Exception as e:
+        print(f"Error drawing graph {key}: {e}")
+    finally:
+        with _pending_lock:
+            _pending.pop(key, None)
+
+
+def submit(question, query_embedding, best_match_index, store):
+    """Queues the plot for question and returns its key at once; see status()."""
+    key = graph_key(store.version, question)
+    with _pending_lock:
+        if key in _pending or os.path.exists(graph_path(key)):
+            return key
+        _pending[key] = _executor.submit(_render_logged, key, query_embedding, best_match_index, store)
+    return key
+
+
+def status(key):
+    """"ready", "pending" or "missing" (never requested, failed, or pruned)."""
+    if os.path.exists(graph_path(key)):
+        return "ready"
+    with _pending_lock:
+        return "pending" if key in _pending else "missing"